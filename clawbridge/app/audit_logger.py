@@ -1,165 +1,366 @@
 """Audit logger for ClawBridge.
 
-Logs all AI-initiated service calls to a JSONL file.
-Thread-safe (asyncio lock). Supports retention policies and stats aggregation.
+Logs all AI-initiated service calls to JSONL files, one per UTC day
+(audit/YYYY-MM-DD.jsonl). Thread-safe (asyncio lock). Supports retention
+policies and stats aggregation.
+
+Because file names carry the date, retention is a matter of deleting whole
+files and readers only open the days overlapping their window. Per-day
+counters live in a small rollup sidecar (audit_stats.json) so all-time totals
+never require reading old files.
 """
 
 import asyncio
-import json
+import contextlib
 import logging
+import mmap
 import os
+import shutil
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
 from collections import Counter
 from datetime import datetime, timezone, timedelta
+from itertools import compress
+
+import fast_json
 
 logger = logging.getLogger(__name__)
 
 AUDIT_DIR = "/data"
-AUDIT_FILE = os.path.join(AUDIT_DIR, "audit.jsonl")
+SHARD_DIR = os.path.join(AUDIT_DIR, "audit")
+STATS_FILE = os.path.join(AUDIT_DIR, "audit_stats.json")
+# Single-file layout used before per-day shards; migrated on first use
+LEGACY_FILE = os.path.join(AUDIT_DIR, "audit.jsonl")
+LEGACY_INDEX_FILE = os.path.join(AUDIT_DIR, "audit_index.json")
 MAX_RETURN_ENTRIES = 500
+# How long a get_stats result may be reused while no entries were written
+STATS_CACHE_SECONDS = 5
+# Entries allowed to wait for the writer. Past this, new entries are dropped
+# (and counted) so a stalled disk can't grow memory without bound
+MAX_QUEUED_ENTRIES = 10_000
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US_PER_HOUR = 3_600_000_000
 
 
 class AuditLogger:
-    """Append-only JSONL audit logger for AI-initiated actions."""
+    """Append-only JSONL audit logger for AI-initiated actions.
+
+    File I/O runs in worker threads (asyncio.to_thread) so slow disks never
+    stall the event loop. log_action only queues the encoded entry and never
+    waits; a single writer task drains the queue and appends whole batches
+    with one write.
+    Batch appends, sidecar updates and cleanup take the lock exclusively;
+    get_stats only needs it shared, and log reads do not need it at all.
+    """
 
     def __init__(self):
-        self._lock = asyncio.Lock()
+        self._lock = _RWLock()
+        # (entry, encoded line) awaiting write
+        self._queue = asyncio.Queue(maxsize=MAX_QUEUED_ENTRIES)
+        self._writer_task = None
+        self._dropped = 0  # entries lost to a full queue since startup
+        # Rollup sidecar: { "YYYY-MM-DD": {count, results, bytes} } per day file
+        self._days = None
+        # Append descriptor for the current day file, kept open between batches
+        self._fd = None
+        self._fd_day = None
+        # Recent entries in columnar form for get_stats (see _StatsWindow).
+        # Concurrent get_stats threads may load or trim it, so they take
+        # _window_lock while touching it; the writer holds the lock exclusively.
+        self._window = None
+        self._window_lock = threading.Lock()
+        # Bumped whenever the log changes; keys the get_stats cache
+        self._generation = 0
+        self._stats_cache = None  # ((generation, hours), monotonic time, result)
 
     async def log_action(self, event_type, entity_id=None, domain=None, service=None,
                          parameters=None, source_ip=None, result="success", error=None,
                          response_time_ms=None):
         """Log a single audit event."""
+        # ts_us (epoch microseconds) is what readers compare against; the
+        # ISO timestamp is kept for display and serialized by the JSON encoder
+        ts_us = time.time_ns() // 1000
         entry = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": _EPOCH + timedelta(microseconds=ts_us),
+            "ts_us": ts_us,
             "event_type": event_type,
-            "entity_id": entity_id,
-            "domain": domain,
-            "service": service,
-            "parameters": parameters,
-            "source_ip": source_ip,
-            "result": result,
-            "error": error,
-            "response_time_ms": response_time_ms,
         }
-        # Remove None values for compactness
-        entry = {k: v for k, v in entry.items() if v is not None}
-
-        async with self._lock:
+        # Only include set fields, for compactness
+        if entity_id is not None:
+            entry["entity_id"] = entity_id
+        if domain is not None:
+            entry["domain"] = domain
+        if service is not None:
+            entry["service"] = service
+        if parameters is not None:
+            entry["parameters"] = parameters
+        if source_ip is not None:
+            entry["source_ip"] = source_ip
+        if result is not None:
+            entry["result"] = result
+        if error is not None:
+            entry["error"] = error
+        if response_time_ms is not None:
+            entry["response_time_ms"] = response_time_ms
+        line = fast_json.dumps(entry) + b"\n"
+
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._writer())
+        try:
+            self._queue.put_nowait((entry, line))
+        except asyncio.QueueFull:
+            self._dropped += 1
+            if self._dropped % 1000 == 1:
+                logger.warning(
+                    "Audit log writer is behind; dropped %d entries so far", self._dropped
+                )
+
+    async def flush(self):
+        """Wait until every queued entry has been written."""
+        if self._writer_task is not None and not self._writer_task.done():
+            await self._queue.join()
+
+    async def close(self):
+        """Flush pending entries and stop the writer task."""
+        await self.flush()
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+        self._close_fd()
+
+    async def _writer(self):
+        """Drain the queue, appending everything queued so far in one write."""
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
             try:
-                os.makedirs(AUDIT_DIR, exist_ok=True)
-                with open(AUDIT_FILE, "a") as f:
-                    f.write(json.dumps(entry) + "\n")
+                async with self._lock.write():
+                    await asyncio.to_thread(self._append_batch_sync, batch)
             except Exception as e:
                 logger.error("Failed to write audit log: %s", e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _append_batch_sync(self, batch):
+        self._ensure_rollup()
+        # A batch only spans two days around UTC midnight; write each run separately
+        run_day, run = None, []
+        for entry, line in batch:
+            day = entry["timestamp"].date().isoformat()
+            if day != run_day and run:
+                self._append_run(run_day, run)
+                run = []
+            run_day = day
+            run.append((entry, line))
+        if run:
+            self._append_run(run_day, run)
+        _write_json_atomic(STATS_FILE, {"days": self._days})
+        self._generation += 1
+
+    def _append_run(self, day, run):
+        if day != self._fd_day:
+            # Rotate to the new day's file (or open the first one)
+            self._close_fd()
+            self._fd = os.open(_shard_path(day), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+            self._fd_day = day
+        data = memoryview(b"".join(line for _, line in run))
+        while data:
+            data = data[os.write(self._fd, data):]
+        stats = self._days.get(day)
+        if stats is None:
+            stats = self._days[day] = _new_day_stats()
+        for entry, line in run:
+            _fold(stats, entry)
+            stats["bytes"] += len(line)
+            if self._window is not None:
+                self._window.append(entry)
+
+    def _close_fd(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._fd_day = None
+
+    # ── Day files / rollup sidecar ────────────────
+
+    async def _load(self):
+        """Make sure the day files and rollup are ready (migrating if needed)."""
+        if self._days is None:
+            async with self._lock.write():
+                await asyncio.to_thread(self._ensure_rollup)
+
+    def _ensure_rollup(self):
+        """Load the rollup sidecar, reconciling it with the day files on disk."""
+        if self._days is not None:
+            return
+        if not os.path.isdir(SHARD_DIR):
+            if os.path.exists(LEGACY_FILE):
+                _migrate_legacy()
+            else:
+                os.makedirs(SHARD_DIR)
+        elif os.path.exists(LEGACY_FILE):
+            # Left behind by a migration interrupted after the day files were in place
+            os.remove(LEGACY_FILE)
+
+        saved = _read_json(STATS_FILE)
+        saved_days = saved.get("days") if isinstance(saved, dict) else None
+        if not isinstance(saved_days, dict):
+            saved_days = {}
+        days = {}
+        changed = False
+        for day in _list_shards():
+            path = _shard_path(day)
+            size = os.path.getsize(path)
+            stats = saved_days.get(day)
+            if not _valid_day_stats(stats) or stats["bytes"] > size:
+                # Missing, malformed or from a different file: count it from scratch
+                stats = _new_day_stats()
+            if stats["bytes"] < size:
+                # Entries written without updating the sidecar (e.g. crash): catch up
+                for _, line in _iter_lines(path, stats["bytes"], size):
+                    try:
+                        _fold(stats, fast_json.loads(line))
+                    except (fast_json.JSONDecodeError, AttributeError):
+                        continue
+                stats["bytes"] = size
+                changed = True
+            days[day] = stats
+        self._days = days
+        if changed or days.keys() != saved_days.keys():
+            _write_json_atomic(STATS_FILE, {"days": days})
+
+    # ── Readers ───────────────────────────────────
 
     async def get_logs(self, limit=200, entity_filter=None, result_filter=None,
                        since=None, until=None):
         """Read audit log entries with optional filters. Returns newest first."""
+        limit = min(limit, MAX_RETURN_ENTRIES)
+        await self.flush()
+        if limit <= 0:
+            return []
+
+        # Appends never rewrite existing bytes, so reading needs no lock
+        try:
+            await self._load()
+            return await asyncio.to_thread(
+                self._read_logs_sync, limit, entity_filter, result_filter, since, until,
+            )
+        except Exception as e:
+            logger.error("Failed to read audit log: %s", e)
+            return []
+
+    def _read_logs_sync(self, limit, entity_filter, result_filter, since, until):
         entries = []
-        if not os.path.exists(AUDIT_FILE):
-            return entries
-
-        async with self._lock:
+        since_us = _iso_to_us(since) if since else None
+        until_us = _iso_to_us(until) if until else None
+        # Walk backwards from the newest day file so only the newest entries are read
+        lines = _iter_shards_reverse(
+            _us_to_day(since_us) if since_us is not None else None,
+            _us_to_day(until_us) if until_us is not None else None,
+        )
+        for line in lines:
             try:
-                with open(AUDIT_FILE, "r") as f:
-                    for line in f:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        try:
-                            entry = json.loads(line)
-                        except json.JSONDecodeError:
-                            continue
-
-                        if entity_filter and entry.get("entity_id") != entity_filter:
-                            continue
-                        if result_filter and entry.get("result") != result_filter:
-                            continue
-                        if since:
-                            ts = entry.get("timestamp", "")
-                            if ts < since:
-                                continue
-                        if until:
-                            ts = entry.get("timestamp", "")
-                            if ts > until:
-                                continue
-
-                        entries.append(entry)
-            except Exception as e:
-                logger.error("Failed to read audit log: %s", e)
-
-        entries.reverse()
-        return entries[:min(limit, MAX_RETURN_ENTRIES)]
+                entry = fast_json.loads(line)
+            except fast_json.JSONDecodeError:
+                continue
+
+            if since_us is not None or until_us is not None:
+                ts_us = _entry_us(entry)
+                if ts_us is None:
+                    continue
+                if since_us is not None and ts_us < since_us:
+                    break  # Entries are appended in time order
+                if until_us is not None and ts_us > until_us:
+                    continue
+            if entity_filter and entry.get("entity_id") != entity_filter:
+                continue
+            if result_filter and entry.get("result") != result_filter:
+                continue
+
+            entries.append(entry)
+            if len(entries) >= limit:
+                break
+        return entries
 
     async def get_stats(self, hours=24):
         """Aggregate audit log statistics for the dashboard.
         Returns dict with counts, top entities, hourly breakdown, etc.
+
+        All-time totals come from the rollup sidecar; only the day files
+        covering the 24h/7d windows are read and parsed. Dashboards poll this,
+        so a result is reused for a few seconds as long as nothing was written.
         """
-        if not os.path.exists(AUDIT_FILE):
+        await self.flush()
+        key = (self._generation, hours)
+        cached = self._stats_cache
+        if (cached is not None and cached[0] == key
+                and time.monotonic() - cached[1] < STATS_CACHE_SECONDS):
+            return dict(cached[2])
+
+        try:
+            await self._load()
+        except Exception as e:
+            logger.error("Failed to load audit stats: %s", e)
             return self._empty_stats()
-
-        now = datetime.now(timezone.utc)
-        cutoff_24h = (now - timedelta(hours=hours)).isoformat()
-        cutoff_7d = (now - timedelta(days=7)).isoformat()
-
-        total_all = 0
-        total_24h = 0
-        total_7d = 0
-        results_all = Counter()
-        results_24h = Counter()
-        entity_calls = Counter()
-        entity_denied = Counter()
-        hourly = Counter()  # hour_offset -> count
-        ip_calls = Counter()
-        response_times = []
-
-        async with self._lock:
+        async with self._lock.read():
             try:
-                with open(AUDIT_FILE, "r") as f:
-                    for line in f:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        try:
-                            entry = json.loads(line)
-                        except json.JSONDecodeError:
-                            continue
-
-                        ts = entry.get("timestamp", "")
-                        result = entry.get("result", "unknown")
-                        eid = entry.get("entity_id", "unknown")
-                        ip = entry.get("source_ip", "unknown")
-                        rt = entry.get("response_time_ms")
-
-                        total_all += 1
-                        results_all[result] += 1
-
-                        if ts >= cutoff_7d:
-                            total_7d += 1
-
-                        if ts >= cutoff_24h:
-                            total_24h += 1
-                            results_24h[result] += 1
-                            entity_calls[eid] += 1
-                            ip_calls[ip] += 1
-                            if result == "denied":
-                                entity_denied[eid] += 1
-                            if rt is not None:
-                                response_times.append(rt)
-
-                            # Hourly breakdown
-                            try:
-                                entry_time = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                                hour_ago = int((now - entry_time).total_seconds() / 3600)
-                                if 0 <= hour_ago < hours:
-                                    hourly[hour_ago] += 1
-                            except (ValueError, TypeError):
-                                pass
-
+                stats = await asyncio.to_thread(self._compute_stats_sync, hours)
             except Exception as e:
                 logger.error("Failed to compute audit stats: %s", e)
+                return self._empty_stats()
+        self._stats_cache = (key, time.monotonic(), stats)
+        # Callers add their own fields to the result, so hand out copies
+        return dict(stats)
 
-        # Build hourly array (0 = most recent hour)
-        hourly_array = [hourly.get(i, 0) for i in range(hours)]
+    def _compute_stats_sync(self, hours):
+        if not self._days:
+            return self._empty_stats()
+
+        now_us = time.time_ns() // 1000
+        cutoff_24h = now_us - hours * _US_PER_HOUR
+        cutoff_7d = now_us - 7 * 24 * _US_PER_HOUR
+
+        total_all = 0
+        results_all = Counter()
+        for stats in self._days.values():
+            total_all += stats["count"]
+            results_all.update(stats["results"])
+        with self._window_lock:
+            win = self._stats_window(min(cutoff_24h, cutoff_7d))
+            strings = win.strings
+            denied_id = win.id_of("denied")
+            # Columns are in time order, so each window is a suffix found by bisection
+            total_7d = len(win.ts) - bisect_left(win.ts, cutoff_7d)
+            start = bisect_left(win.ts, cutoff_24h)
+            ts_24h = win.ts[start:]
+            result_24h = win.result[start:]
+            entity_24h = win.entity[start:]
+            ip_24h = win.ip[start:]
+            rt_24h = win.rt[start:]
+        total_24h = len(ts_24h)
+
+        # Counting over the int columns runs in C; ids map back to strings at the end
+        results_24h = _decode(Counter(result_24h), strings)
+        entity_calls = _decode(Counter(entity_24h), strings)
+        ip_calls = _decode(Counter(ip_24h), strings)
+        entity_denied = _decode(Counter(
+            compress(entity_24h, map(denied_id.__eq__, result_24h))
+        ), strings) if denied_id is not None else Counter()
+        response_times = [rt for rt in rt_24h if rt >= 0]
+
+        # Hourly breakdown (0 = most recent hour): bucket edges by bisection
+        # instead of visiting every entry
+        edges = [bisect_right(ts_24h, now_us - i * _US_PER_HOUR) for i in range(hours + 1)]
+        hourly_array = [edges[i] - edges[i + 1] for i in range(hours)]
 
         avg_response = int(sum(response_times) / len(response_times)) if response_times else 0
 
@@ -179,6 +380,28 @@ class AuditLogger:
             ) if total_24h > 0 else 0,
         }
 
+    def _stats_window(self, since):
+        """Return the columnar window covering entries at or after since (epoch µs).
+
+        Loaded from the day files on first use (or when a wider window is
+        requested), then kept current by the writer and trimmed as it ages.
+        """
+        win = self._window
+        if win is None or since < win.since:
+            win = _StatsWindow(since)
+            since_day = _us_to_day(since)
+            for day in sorted(d for d in self._days if d >= since_day):
+                for _, line in _iter_lines(_shard_path(day)):
+                    try:
+                        win.append(fast_json.loads(line))
+                    except fast_json.JSONDecodeError:
+                        continue
+            win.trim(since)
+            self._window = win
+        elif since - win.since > _US_PER_HOUR:
+            win.trim(since)
+        return win
+
     def _empty_stats(self):
         return {
             "total_all_time": 0, "total_24h": 0, "total_7d": 0,
@@ -190,52 +413,467 @@ class AuditLogger:
 
     async def cleanup_old_logs(self, retention_days=30):
         """Remove audit entries older than retention_days."""
-        if not os.path.exists(AUDIT_FILE):
-            return 0
-
-        cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).isoformat()
-        kept = []
-        removed = 0
+        cutoff = time.time_ns() // 1000 - retention_days * 24 * _US_PER_HOUR
 
-        async with self._lock:
+        async with self._lock.write():
             try:
-                with open(AUDIT_FILE, "r") as f:
-                    for line in f:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        try:
-                            entry = json.loads(line)
-                        except json.JSONDecodeError:
-                            continue
-                        if entry.get("timestamp", "") >= cutoff:
-                            kept.append(line)
-                        else:
-                            removed += 1
-
-                with open(AUDIT_FILE, "w") as f:
-                    for line in kept:
-                        f.write(line + "\n")
-
-                if removed > 0:
-                    logger.info("Audit cleanup: removed %d old entries, kept %d", removed, len(kept))
+                return await asyncio.to_thread(self._cleanup_sync, cutoff)
             except Exception as e:
                 logger.error("Failed to clean up audit log: %s", e)
+                return 0
 
+    def _cleanup_sync(self, cutoff):
+        self._ensure_rollup()
+        cutoff_day = _us_to_day(cutoff)
+        if self._fd_day is not None and self._fd_day <= cutoff_day:
+            self._close_fd()  # Its file is about to be removed or replaced
+        removed = 0
+        for day in sorted(self._days):
+            if day > cutoff_day:
+                break
+            if day < cutoff_day:
+                # Whole day is past retention: its count is in the rollup already
+                try:
+                    os.remove(_shard_path(day))
+                except FileNotFoundError:
+                    pass
+                removed += self._days.pop(day)["count"]
+            else:
+                removed += self._trim_shard(day, cutoff)
+
+        if removed > 0:
+            self._window = None
+            self._generation += 1
+            _write_json_atomic(STATS_FILE, {"days": self._days})
+            kept = sum(stats["count"] for stats in self._days.values())
+            logger.info("Audit cleanup: removed %d old entries, kept %d", removed, kept)
+        return removed
+
+    def _trim_shard(self, day, cutoff):
+        """Drop the entries before cutoff from the day file straddling it."""
+        path = _shard_path(day)
+        stats = self._days[day]
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            first_keep = _first_offset_at_or_after(f, size, cutoff)
+            if first_keep == 0:
+                return 0
+            if first_keep >= size:
+                os.remove(path)
+                return self._days.pop(day)["count"]
+
+            # Only the removed prefix is parsed, to take it out of the rollup
+            results = stats["results"]
+            removed = 0
+            for _, line in _iter_lines(path, 0, first_keep, evict=True):
+                try:
+                    entry = fast_json.loads(line)
+                except fast_json.JSONDecodeError:
+                    continue
+                removed += 1
+                result = entry.get("result", "unknown")
+                count = results.get(result, 0) - 1
+                if count > 0:
+                    results[result] = count
+                else:
+                    results.pop(result, None)
+
+            # Copy the retained suffix into a new file and swap it in
+            tmp = path + ".tmp"
+            out = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o640)
+            try:
+                _copy_range(f.fileno(), out, first_keep, size - first_keep)
+                # Durable before it replaces the original, so a crash leaves
+                # either the old file or the complete new one
+                os.fsync(out)
+            finally:
+                os.close(out)
+            # The old file is about to be replaced; don't keep its pages cached
+            _fadvise(f.fileno(), 0, 0, "POSIX_FADV_DONTNEED")
+        os.replace(tmp, path)
+        _fsync_dir(SHARD_DIR)
+        stats["count"] = max(0, stats["count"] - removed)
+        stats["bytes"] = max(0, stats["bytes"] - first_keep)
         return removed
 
     async def clear_logs(self):
         """Clear all audit logs."""
-        async with self._lock:
+        await self.flush()
+        async with self._lock.write():
             try:
-                if os.path.exists(AUDIT_FILE):
-                    os.remove(AUDIT_FILE)
-                    logger.info("Audit log cleared")
+                await asyncio.to_thread(self._clear_sync)
+                logger.info("Audit log cleared")
             except Exception as e:
                 logger.error("Failed to clear audit log: %s", e)
 
+    def _clear_sync(self):
+        self._close_fd()
+        if os.path.isdir(SHARD_DIR):
+            for day in _list_shards():
+                os.remove(_shard_path(day))
+        for path in (STATS_FILE, LEGACY_FILE, LEGACY_INDEX_FILE):
+            if os.path.exists(path):
+                os.remove(path)
+        self._days = {}
+        self._window = None
+        self._generation += 1
+
     async def periodic_cleanup(self, retention_days=30):
         """Background task to clean up old audit entries daily."""
         while True:
             await asyncio.sleep(86400)
             await self.cleanup_old_logs(retention_days)
+
+
+class _RWLock:
+    """Readers-writer lock for asyncio tasks.
+
+    Any number of readers may hold it together; a writer holds it alone.
+    Readers pass through the writer mutex on the way in, so once a writer is
+    queued new readers wait behind it and appends are never starved.
+    """
+
+    def __init__(self):
+        self._writer = asyncio.Lock()
+        self._readers = 0
+        self._no_readers = asyncio.Event()
+        self._no_readers.set()
+
+    @contextlib.asynccontextmanager
+    async def read(self):
+        async with self._writer:
+            self._readers += 1
+            self._no_readers.clear()
+        try:
+            yield
+        finally:
+            self._readers -= 1
+            if not self._readers:
+                self._no_readers.set()
+
+    @contextlib.asynccontextmanager
+    async def write(self):
+        async with self._writer:
+            await self._no_readers.wait()
+            yield
+
+
+class _StatsWindow:
+    """Recent audit entries stored column-wise for fast aggregation.
+
+    Only the fields get_stats needs are kept: timestamps as epoch microseconds
+    and dictionary-encoded ids for result, entity and source IP, which is
+    far more compact than the parsed JSON dicts.
+    """
+
+    def __init__(self, since):
+        self.since = since
+        self.ts = array("q")
+        self.result = array("I")
+        self.entity = array("I")
+        self.ip = array("I")
+        self.rt = array("q")  # response time in ms, -1 if not recorded
+        self.strings = []  # id -> string
+        self._ids = {}  # string -> id
+
+    def id_of(self, value):
+        """Return the id for value, or None if it never occurred."""
+        return self._ids.get(value)
+
+    def _id(self, value):
+        i = self._ids.get(value)
+        if i is None:
+            i = self._ids[value] = len(self.strings)
+            self.strings.append(value)
+        return i
+
+    def append(self, entry):
+        ts = _entry_us(entry)
+        if ts is None:
+            return
+        rt = entry.get("response_time_ms")
+        self.ts.append(ts)
+        self.result.append(self._id(entry.get("result", "unknown")))
+        self.entity.append(self._id(entry.get("entity_id", "unknown")))
+        self.ip.append(self._id(entry.get("source_ip", "unknown")))
+        self.rt.append(int(rt) if isinstance(rt, (int, float)) else -1)
+
+    def trim(self, since):
+        """Drop entries older than since (entries are in time order)."""
+        drop = bisect_left(self.ts, since)
+        if drop:
+            for column in (self.ts, self.result, self.entity, self.ip, self.rt):
+                del column[:drop]
+        self.since = since
+
+
+def _iso_to_us(value):
+    """Convert an ISO 8601 timestamp to epoch microseconds (naive = UTC), or None."""
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def _entry_us(entry):
+    """Epoch microseconds of an entry. Entries written before ts_us existed
+    only carry the ISO timestamp, which is parsed instead.
+    """
+    ts_us = entry.get("ts_us")
+    if ts_us is None:
+        ts_us = _iso_to_us(entry.get("timestamp"))
+    return ts_us
+
+
+def _us_to_day(ts_us):
+    """UTC date (YYYY-MM-DD) of an epoch-microsecond timestamp."""
+    return (_EPOCH + timedelta(microseconds=ts_us)).date().isoformat()
+
+
+def _new_day_stats():
+    return {"count": 0, "results": {}, "bytes": 0}
+
+
+def _valid_day_stats(stats):
+    """Whether a day entry read from the sidecar has the shape _new_day_stats() builds."""
+    if not isinstance(stats, dict):
+        return False
+    count, results, size = stats.get("count"), stats.get("results"), stats.get("bytes")
+    return (
+        type(count) is int and count >= 0
+        and type(size) is int and size >= 0
+        and isinstance(results, dict)
+        and all(type(n) is int for n in results.values())
+    )
+
+
+def _fold(stats, entry):
+    """Count one entry into a day's rollup."""
+    stats["count"] += 1
+    results = stats["results"]
+    result = entry.get("result", "unknown")
+    results[result] = results.get(result, 0) + 1
+
+
+def _decode(counts, strings):
+    """Map a Counter keyed by dictionary ids back to one keyed by strings."""
+    return Counter({strings[i]: n for i, n in counts.items()})
+
+
+def _shard_path(day):
+    return os.path.join(SHARD_DIR, day + ".jsonl")
+
+
+def _list_shards():
+    """Dates of the day files on disk, oldest first (names sort chronologically)."""
+    return sorted(
+        name[:-6] for name in os.listdir(SHARD_DIR)
+        if name.endswith(".jsonl") and len(name) == 16
+    )
+
+
+def _iter_shards_reverse(since_day=None, until_day=None):
+    """Yield lines newest first from the day files between since_day and until_day."""
+    for day in reversed(_list_shards()):
+        if until_day is not None and day > until_day:
+            continue
+        if since_day is not None and day < since_day:
+            break
+        try:
+            yield from _iter_lines_reverse(_shard_path(day))
+        except FileNotFoundError:
+            continue  # Removed by a concurrent cleanup
+
+
+def _migrate_legacy():
+    """Split the old single audit.jsonl into day files, then remove it.
+
+    The day files are built in a temporary directory that is renamed into
+    place, so an interrupted migration simply starts over.
+    """
+    tmp_dir = SHARD_DIR + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    out, out_day = None, None
+    try:
+        for _, line in _iter_lines(LEGACY_FILE, evict=True):
+            try:
+                ts_us = _entry_us(fast_json.loads(line))
+            except (fast_json.JSONDecodeError, AttributeError):
+                continue
+            if ts_us is None:
+                continue
+            day = _us_to_day(ts_us)
+            if day != out_day:
+                if out is not None:
+                    out.close()
+                out = open(os.path.join(tmp_dir, day + ".jsonl"), "ab")
+                out_day = day
+            out.write(line + b"\n")
+    finally:
+        if out is not None:
+            out.close()
+    # Flush the day files before the directory appears under its real name
+    for name in os.listdir(tmp_dir):
+        fd = os.open(os.path.join(tmp_dir, name), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    _fsync_dir(tmp_dir)
+    os.rename(tmp_dir, SHARD_DIR)
+    _fsync_dir(AUDIT_DIR)
+    os.remove(LEGACY_FILE)
+    if os.path.exists(LEGACY_INDEX_FILE):
+        os.remove(LEGACY_INDEX_FILE)
+    logger.info("Migrated audit log to per-day files in %s", SHARD_DIR)
+
+
+def _iter_lines(path, start=0, stop=None, evict=False):
+    """Yield (offset, line) for each non-empty line from byte offset start up to
+    stop (EOF by default).
+
+    The file is mapped into memory once and split on newlines, avoiding the
+    per-line overhead of Python's buffered text reader. The kernel is told the
+    scan is sequential; with evict=True the pages are dropped from the cache
+    afterwards, for one-off scans of data that will not be read again.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if stop is not None:
+            size = min(size, stop)
+        if size <= start:
+            return
+        _fadvise(f.fileno(), start, size - start, "POSIX_FADV_SEQUENTIAL")
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                pos = start
+                while pos < size:
+                    end = mm.find(b"\n", pos)
+                    if end == -1:
+                        end = size
+                    if end > pos:
+                        yield pos, mm[pos:end]
+                    pos = end + 1
+        finally:
+            if evict:
+                _fadvise(f.fileno(), start, size - start, "POSIX_FADV_DONTNEED")
+
+
+def _fadvise(fd, offset, length, advice):
+    """posix_fadvise where the platform supports it (Linux); a no-op elsewhere."""
+    advice = getattr(os, advice, None)
+    if advice is not None and hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, offset, length, advice)
+        except OSError:
+            pass
+
+
+def _first_offset_at_or_after(f, size, cutoff_us):
+    """Binary-search an open log for the first line with a timestamp >= cutoff_us.
+
+    Relies on entries being appended in time order. Returns the byte offset of
+    that line, or size if every entry is older. Unparseable lines are treated as
+    retained so a damaged line never causes newer data to be dropped.
+    """
+    def line_start(pos):
+        if pos == 0:
+            return 0
+        f.seek(pos - 1)
+        f.readline()
+        return f.tell()
+
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = line_start(mid)
+        if start >= size:
+            hi = mid
+            continue
+        f.seek(start)
+        try:
+            ts_us = _entry_us(fast_json.loads(f.readline()))
+        except (fast_json.JSONDecodeError, AttributeError):
+            ts_us = None
+        if ts_us is None or ts_us >= cutoff_us:
+            hi = mid
+        else:
+            lo = start + 1
+    return line_start(lo)
+
+
+def _iter_lines_reverse(path, chunk_size=65536):
+    """Yield non-empty lines from the end of the file towards the start."""
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        carry = b""
+        while pos > 0:
+            read_size = min(chunk_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            lines = (f.read(read_size) + carry).split(b"\n")
+            # The first piece may continue in the previous chunk
+            carry = lines[0]
+            for line in reversed(lines[1:]):
+                if line:
+                    yield line
+        if carry:
+            yield carry
+
+
+def _copy_range(src_fd, dst_fd, offset, count):
+    """Copy count bytes starting at offset in src_fd to the end of dst_fd.
+
+    Uses copy_file_range so the data stays in the kernel (and may be a
+    reflink on filesystems that support it), falling back to pread/write
+    where it is unavailable or refused.
+    """
+    copy_file_range = getattr(os, "copy_file_range", None)
+    while count > 0:
+        if copy_file_range is not None:
+            try:
+                n = copy_file_range(src_fd, dst_fd, count, offset)
+            except OSError:
+                copy_file_range = None
+                continue
+        else:
+            data = memoryview(os.pread(src_fd, min(count, 1024 * 1024), offset))
+            n = len(data)
+            while data:
+                data = data[os.write(dst_fd, data):]
+        if n == 0:
+            break  # Source is shorter than expected
+        offset += n
+        count -= n
+
+
+def _fsync_dir(path):
+    """fsync a directory so renames and unlinks inside it are durable."""
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _read_json(path):
+    """Read a JSON sidecar file, returning None if missing or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            return fast_json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json_atomic(path, data):
+    """Write a JSON sidecar file via write-to-temp + rename."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(fast_json.dumps(data))
+    os.replace(tmp, path)
@@ -5,19 +5,60 @@ constraints, API keys, schedules, and confirmation settings.
 Stores config in /data/ directory (mapped via addon_config).
 """
 
-import json
+import asyncio
+import copy
+import mmap
 import os
 import logging
 import secrets
-import string
+import shutil
+import time
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime, timezone
+from types import MappingProxyType
+
+import fast_json
 
 logger = logging.getLogger(__name__)
 
 CONFIG_DIR = "/data"
+# Original single-file config; split into the shards below on first run
 CONFIG_FILE = os.path.join(CONFIG_DIR, "ai_sensor_exporter.json")
+# Config is split per concern so a change only rewrites its own file
+SHARD_DIR = os.path.join(CONFIG_DIR, "config")
+SHARD_MAP = {
+    "exposed_entities": "entities.json",
+    # Presets can be large and change independently of the live selection
+    "presets": "presets.json",
+    "entity_annotations": "entities.json",
+    "entity_constraints": "entities.json",
+    "api_keys": "security.json",
+    "allowed_ips": "security.json",
+    "audit_enabled": "security.json",
+    "audit_retention_days": "security.json",
+    "rate_limit_per_minute": "security.json",
+    "schedules": "schedules.json",
+    "entity_schedules": "schedules.json",
+    "entity_groups": "groups.json",
+}
+# Everything not listed above
+DEFAULT_SHARD = "settings.json"
+ALL_SHARDS = frozenset(SHARD_MAP.values()) | {DEFAULT_SHARD}
+# Configs larger than this are parsed from a memory mapping
+MMAP_LOAD_THRESHOLD = 512 * 1024
+
+VALID_ACCESS_LEVELS = frozenset({"read", "confirm", "control"})
+# Levels that allow service calls
+_ACTIONABLE = frozenset({"confirm", "control"})
+
+# Changes are written this long after the last one, so bursts coalesce
+SAVE_DELAY_SECONDS = 0.25
+
+_MISSING = object()
 
-VALID_ACCESS_LEVELS = ("read", "confirm", "control")
+# Weekdays a schedule allows when it has no usable "days" list (0=Monday)
+ALL_WEEKDAYS = frozenset(range(7))
 
 DEFAULT_CONFIG = {
     # Unified entity model: { entity_id: "read"|"confirm"|"control" }
@@ -52,29 +93,101 @@ DEFAULT_CONFIG = {
 
 
 class ConfigManager:
+    """Holds the add-on configuration. Starts out with the defaults; call
+    load() once to read the stored config before serving requests.
+    """
+
     def __init__(self):
-        self._config = dict(DEFAULT_CONFIG)
-        self._load()
-
-    def _load(self):
-        """Load configuration from disk and migrate old format if needed."""
-        if os.path.exists(CONFIG_FILE):
-            try:
-                with open(CONFIG_FILE, "r") as f:
-                    data = json.load(f)
-                # Ensure defaults for any new keys
-                for key, default_val in DEFAULT_CONFIG.items():
-                    if key not in data:
-                        data[key] = default_val
-                self._config.update(data)
-                logger.info("Configuration loaded")
-            except Exception as e:
-                logger.error("Failed to load config: %s", e)
+        self._config = copy.deepcopy(DEFAULT_CONFIG)
+        # Shard file names with unsaved changes
+        self._dirty = set()
+        # Bumped on every change (every change goes through _save)
+        self._revision = 0
+        self._suspend_save = 0
+        self._save_handle = None
+        # fsync every save before it replaces the old file. Off by default: the
+        # rename alone already prevents torn files, and a sync per save is slow.
+        # flush(durable=True) syncs regardless
+        self._fsync_enabled = False
+        # Bearer token -> key_id, so authenticating a request is one lookup
+        self._token_index = {}
+        # allowed_ips as a set for the per-request allowlist check
+        self._allowed_ip_set = frozenset()
+        # Exposed entities bucketed by access level (dicts used as ordered sets),
+        # plus how many confirm/control entities each domain has
+        self._by_level = {level: {} for level in VALID_ACCESS_LEVELS}
+        self._control_domains = Counter()
+        # Read-only view of exposed_entities handed out by the property; rebound
+        # whenever the underlying dict is replaced
+        self._exposed_view = MappingProxyType(self._config["exposed_entities"])
+        # schedule_id -> (allowed weekdays, start minute, end minute), parsed on
+        # first use; start/end are None for a malformed schedule
+        self._schedule_cache = {}
+        # entity_id -> ((param, min, max), ...) flattened from entity_constraints
+        self._constraint_cache = {}
+
+    def load(self):
+        """Load configuration from disk and migrate old format if needed.
+
+        Only touches this manager's own state, so the server runs it on a worker
+        thread alongside the rest of startup.
+        """
+        legacy = not os.path.isdir(SHARD_DIR)
+        misplaced = {}
+        if legacy:
+            data = _read_config_file(CONFIG_FILE)
         else:
+            data = {}
+            for shard in ALL_SHARDS:
+                stored = _read_config_file(os.path.join(SHARD_DIR, shard)) or {}
+                for key, value in stored.items():
+                    if SHARD_MAP.get(key, DEFAULT_SHARD) == shard:
+                        data[key] = value
+                    else:
+                        # Left in another file by an older shard layout
+                        misplaced[key] = value
+            # A copy in the key's own shard is always the newer one
+            for key in misplaced.keys() - data.keys():
+                data[key] = misplaced[key]
+        if data is None:
             logger.info("No existing config found, using defaults")
+        elif data:
+            # Stored values over defaults in one C-level merge
+            self._config = DEFAULT_CONFIG | data
+            logger.info("Configuration loaded")
 
+        self._ensure_keys()
         # Migrate from old format (selected_entities list + exposed_actions dict)
         self._migrate_old_format()
+        self._rebuild_token_index()
+        self._allowed_ip_set = frozenset(self.allowed_ips)
+        self._rebuild_exposed_indexes()
+        self._revision += 1
+        if legacy and data:
+            logger.info("Splitting %s into %s", CONFIG_FILE, SHARD_DIR)
+            self._save()
+        elif misplaced:
+            logger.info("Moving %s to their own config files", ", ".join(sorted(misplaced)))
+            self._save()
+
+    @property
+    def revision(self):
+        """Number that changes whenever the configuration does, for keying caches."""
+        return self._revision
+
+    def _ensure_keys(self):
+        """Fill in defaults for missing keys and give every container key its
+        own dict/list of the right type. Mutators rely on this to update the
+        stored dicts in place.
+        """
+        for key, default_val in DEFAULT_CONFIG.items():
+            if isinstance(default_val, (dict, list)):
+                current = self._config.get(key)
+                # Never hand out DEFAULT_CONFIG's own containers
+                if current is default_val or not isinstance(current, type(default_val)):
+                    self._config[key] = copy.deepcopy(default_val)
+            elif key not in self._config:
+                self._config[key] = default_val
 
     def _migrate_old_format(self):
         """Convert old selected_entities list + exposed_actions to unified exposed_entities dict."""
@@ -108,72 +221,221 @@ class ConfigManager:
             logger.info("Migrated old exposed_actions -> promoted entities to control access")
 
         if migrated:
-            self._config["exposed_entities"] = exposed
-            self._save()
+            with self.batch():
+                self._config["exposed_entities"] = exposed
+                self._save("exposed_entities")
             logger.info("Migration complete: %d entities (%d read, %d control)",
                         len(exposed),
                         sum(1 for v in exposed.values() if v == "read"),
                         sum(1 for v in exposed.values() if v == "control"))
 
-    def _save(self):
-        """Persist configuration to disk."""
+        # Chat was removed in 1.7.0; its history would otherwise be re-encoded
+        # on every save
+        if self._config.pop("chat_history", None) is not None:
+            self._save()
+            logger.info("Removed stored chat history left over from the chat feature")
+
+    def _save(self, *keys):
+        """Mark the shards holding keys changed (all of them if no keys are
+        given) and schedule a write.
+
+        Writes are debounced on the event loop so a burst of setters costs one
+        write; inside batch() nothing is written until the block exits. With
+        no running loop (e.g. during startup) the write happens immediately.
+        """
+        self._revision += 1
+        if keys:
+            self._dirty.update(SHARD_MAP.get(key, DEFAULT_SHARD) for key in keys)
+        else:
+            self._dirty.update(ALL_SHARDS)
+        if self._suspend_save or self._save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        self._save_handle = loop.call_later(SAVE_DELAY_SECONDS, self.flush)
+
+    def _set(self, key, value):
+        """Store value under key and schedule a save, unless it is unchanged.
+        Returns True if the value changed.
+        """
+        current = self._config.get(key, _MISSING)
+        # A container passed back after being edited in place always counts as changed
+        if current == value and not (current is value and isinstance(value, (dict, list))):
+            return False
+        self._config[key] = value
+        self._save(key)
+        return True
+
+    def flush(self, durable=False):
+        """Write any pending changes to disk now. With durable=True the written
+        files are fsynced before they replace the old ones (used on shutdown).
+        """
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if self._dirty:
+            shards, self._dirty = self._dirty, set()
+            self._save_now(shards, durable or self._fsync_enabled)
+
+    @contextmanager
+    def batch(self):
+        """Group several changes into a single write when the block exits."""
+        self._suspend_save += 1
         try:
-            os.makedirs(CONFIG_DIR, exist_ok=True)
-            with open(CONFIG_FILE, "w") as f:
-                json.dump(self._config, f, indent=2)
-            logger.debug("Configuration saved")
+            yield self
+        finally:
+            self._suspend_save -= 1
+            if not self._suspend_save:
+                self.flush()
+
+    def _save_now(self, shards, durable=False):
+        """Persist the given config shards to disk.
+
+        The first write (fresh install, or splitting CONFIG_FILE) builds every
+        shard in a temporary directory that is renamed to SHARD_DIR, so the
+        directory only appears complete. Until then load() keeps reading
+        CONFIG_FILE, and an interrupted split simply starts over.
+        """
+        try:
+            target_dir = SHARD_DIR
+            if not os.path.isdir(SHARD_DIR):
+                shards, durable = ALL_SHARDS, True
+                target_dir = SHARD_DIR + ".tmp"
+                shutil.rmtree(target_dir, ignore_errors=True)
+                os.makedirs(target_dir)
+            contents = {shard: {} for shard in shards}
+            for key, value in self._config.items():
+                part = contents.get(SHARD_MAP.get(key, DEFAULT_SHARD))
+                if part is not None:
+                    part[key] = value
+            for shard, part in contents.items():
+                path = os.path.join(target_dir, shard)
+                tmp_path = path + ".tmp"
+                # Encode before opening so no fd is held during serialization
+                data = fast_json.dumps(part)
+                # Write-to-temp + rename so a crash never leaves a half-written shard
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                try:
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(fd, view):]
+                    if durable:
+                        os.fsync(fd)
+                finally:
+                    os.close(fd)
+                os.replace(tmp_path, path)
+            if target_dir != SHARD_DIR:
+                _fsync_dir(target_dir)
+                os.rename(target_dir, SHARD_DIR)
+                _fsync_dir(os.path.dirname(SHARD_DIR))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Configuration saved (%s)", ", ".join(sorted(contents)))
         except Exception as e:
+            # Keep the unwritten shards dirty so the next save retries them
+            self._dirty.update(shards)
             logger.error("Failed to save config: %s", e)
 
     # ── Exposed Entities (unified model) ──────────
 
     @property
     def exposed_entities(self):
-        """Dict of entity_id -> 'read'|'confirm'|'control'."""
-        return self._config.get("exposed_entities", {})
+        """Read-only mapping of entity_id -> 'read'|'confirm'|'control'."""
+        return self._exposed_view
 
     @exposed_entities.setter
     def exposed_entities(self, value):
         if not isinstance(value, dict):
             value = {}
-        self._config["exposed_entities"] = {
+        exposed = {
             k: v if v in VALID_ACCESS_LEVELS else "read"
             for k, v in value.items()
-            if isinstance(k, str) and k
+            if type(k) is str and k
         }
-        self._save()
+        if self._set("exposed_entities", exposed):
+            self._rebuild_exposed_indexes()
+
+    def _rebuild_exposed_indexes(self):
+        """Recompute the per-level buckets after exposed_entities was replaced."""
+        exposed = self._config["exposed_entities"]
+        self._exposed_view = MappingProxyType(exposed)
+        self._by_level = {level: {} for level in VALID_ACCESS_LEVELS}
+        self._control_domains = Counter()
+        for eid, access in exposed.items():
+            self._index_entity(eid, None, access)
+
+    def _index_entity(self, entity_id, old, new):
+        """Move entity_id between level buckets (None = not exposed)."""
+        if old == new:
+            return
+        by_level = self._by_level
+        if old in by_level:
+            del by_level[old][entity_id]
+            if old in _ACTIONABLE and "." in entity_id:
+                domain = entity_id.partition(".")[0]
+                self._control_domains[domain] -= 1
+                if self._control_domains[domain] <= 0:
+                    del self._control_domains[domain]
+        if new in by_level:
+            by_level[new][entity_id] = None
+            if new in _ACTIONABLE and "." in entity_id:
+                self._control_domains[entity_id.partition(".")[0]] += 1
+
+    def set_entity_access(self, entity_id, access_level):
+        """Set one entity's access level; "off" (or None) removes it.
+        Returns the previous level, or None if it was not exposed.
+        """
+        if not isinstance(entity_id, str) or not entity_id:
+            return None
+        exposed = self._config["exposed_entities"]
+        if access_level is None or access_level == "off":
+            access_level = None
+            old = exposed.pop(entity_id, None)
+        else:
+            if access_level not in VALID_ACCESS_LEVELS:
+                access_level = "read"
+            old = exposed.get(entity_id)
+            exposed[entity_id] = access_level
+        if old != access_level:
+            self._index_entity(entity_id, old, access_level)
+            self._save("exposed_entities")
+        return old
 
     def get_all_exposed_ids(self):
         """Return list of all exposed entity IDs (read + confirm + control)."""
-        return list(self.exposed_entities.keys())
+        return list(self._config["exposed_entities"])
 
     def get_read_entity_ids(self):
         """Return list of entity IDs with read-only access."""
-        return [eid for eid, access in self.exposed_entities.items() if access == "read"]
+        return list(self._by_level["read"])
 
     def get_confirm_entity_ids(self):
         """Return list of entity IDs with confirm access."""
-        return [eid for eid, access in self.exposed_entities.items() if access == "confirm"]
+        return list(self._by_level["confirm"])
 
     def get_control_entity_ids(self):
         """Return list of entity IDs with control access."""
-        return [eid for eid, access in self.exposed_entities.items() if access == "control"]
+        return list(self._by_level["control"])
 
     def get_actionable_entity_ids(self):
         """Return list of entity IDs with confirm or control access (can call services)."""
-        return [eid for eid, access in self.exposed_entities.items() if access in ("confirm", "control")]
+        return [*self._by_level["confirm"], *self._by_level["control"]]
+
+    def count_exposed(self, access_level=None):
+        """Number of exposed entities, optionally only those at access_level."""
+        if access_level is None:
+            return len(self._config["exposed_entities"])
+        return len(self._by_level.get(access_level, ()))
 
     def is_entity_exposed(self, entity_id):
         """Check if entity is exposed. Returns 'read', 'confirm', 'control', or False."""
-        return self.exposed_entities.get(entity_id, False)
+        return self._config["exposed_entities"].get(entity_id, False)
 
     def get_control_domains(self):
         """Return set of domains that have at least one entity with control or confirm access."""
-        domains = set()
-        for eid, access in self.exposed_entities.items():
-            if access in ("control", "confirm") and "." in eid:
-                domains.add(eid.split(".")[0])
-        return domains
+        return set(self._control_domains)
 
     # ── Backward-compatible selected_entities property ──
 
@@ -185,13 +447,13 @@ class ConfigManager:
     @selected_entities.setter
     def selected_entities(self, entities):
         """Backward compat: set entities (preserves existing access levels)."""
-        old = self.exposed_entities
+        old = self._config["exposed_entities"]
         new_exposed = {}
         for eid in entities:
-            if isinstance(eid, str) and eid:
+            if type(eid) is str and eid:
                 new_exposed[eid] = old.get(eid, "read")
-        self._config["exposed_entities"] = new_exposed
-        self._save()
+        if self._set("exposed_entities", new_exposed):
+            self._rebuild_exposed_indexes()
 
     # ── Annotations ───────────────────────────────
 
@@ -204,11 +466,10 @@ class ConfigManager:
     def entity_annotations(self, value):
         if not isinstance(value, dict):
             value = {}
-        self._config["entity_annotations"] = {
+        self._set("entity_annotations", {
             k: str(v)[:500] for k, v in value.items()
-            if isinstance(k, str) and k and v
-        }
-        self._save()
+            if type(k) is str and k and v
+        })
 
     def get_annotation(self, entity_id):
         """Get annotation for an entity, or None."""
@@ -216,13 +477,12 @@ class ConfigManager:
 
     def set_annotation(self, entity_id, text):
         """Set or remove annotation for an entity."""
-        annotations = self._config.get("entity_annotations", {})
+        annotations = self._config["entity_annotations"]
         if text and text.strip():
             annotations[entity_id] = str(text).strip()[:500]
         else:
             annotations.pop(entity_id, None)
-        self._config["entity_annotations"] = annotations
-        self._save()
+        self._save("entity_annotations")
 
     # ── Constraints ───────────────────────────────
 
@@ -235,8 +495,8 @@ class ConfigManager:
     def entity_constraints(self, value):
         if not isinstance(value, dict):
             value = {}
-        self._config["entity_constraints"] = value
-        self._save()
+        if self._set("entity_constraints", value):
+            self._constraint_cache.clear()
 
     def get_constraints(self, entity_id):
         """Get constraints for an entity, or empty dict."""
@@ -244,33 +504,37 @@ class ConfigManager:
 
     def set_constraints(self, entity_id, constraints):
         """Set or remove constraints for an entity."""
-        all_constraints = self._config.get("entity_constraints", {})
+        all_constraints = self._config["entity_constraints"]
         if constraints:
             all_constraints[entity_id] = constraints
         else:
             all_constraints.pop(entity_id, None)
-        self._config["entity_constraints"] = all_constraints
-        self._save()
+        self._constraint_cache.pop(entity_id, None)
+        self._save("entity_constraints")
 
     def validate_parameters(self, entity_id, params):
         """Validate and clamp parameters against constraints.
         Returns (clamped_params, violations_list).
         violations_list: [{ param, value, min, max, clamped_to }]
         """
-        constraints = self.get_constraints(entity_id)
-        if not constraints or not params:
+        if not params:
+            return params, []
+        limits = self._constraint_cache.get(entity_id)
+        if limits is None:
+            limits = self._constraint_cache[entity_id] = tuple(
+                (param, lim.get("min"), lim.get("max"))
+                for param, lim in self.get_constraints(entity_id).items()
+                if isinstance(lim, dict)
+            )
+        if not limits:
             return params, []
 
         clamped = dict(params)
         violations = []
-        for param, limits in constraints.items():
-            if param not in clamped:
-                continue
-            val = clamped[param]
+        for param, min_val, max_val in limits:
+            val = clamped.get(param)
             if not isinstance(val, (int, float)):
                 continue
-            min_val = limits.get("min")
-            max_val = limits.get("max")
             original = val
             if min_val is not None and val < min_val:
                 val = min_val
@@ -291,11 +555,17 @@ class ConfigManager:
         """Dict of key_id -> key config."""
         return self._config.get("api_keys", {})
 
+    def _rebuild_token_index(self):
+        self._token_index = {
+            cfg["key"]: key_id for key_id, cfg in self.api_keys.items()
+            if isinstance(cfg, dict) and cfg.get("key")
+        }
+
     def create_api_key(self, name, entities=None, rate_limit=None):
         """Create a new API key. Returns (key_id, full_key)."""
-        key_id = "cbk_" + "".join(secrets.choice(string.ascii_lowercase + string.digits) for _ in range(8))
+        keys = self._config["api_keys"]
+        key_id = _new_id("cbk_", 4, keys)
         full_key = "cb_" + secrets.token_urlsafe(32)
-        keys = self._config.get("api_keys", {})
         keys[key_id] = {
             "name": str(name)[:100],
             "key": full_key,
@@ -303,26 +573,25 @@ class ConfigManager:
             "rate_limit": rate_limit or 0,  # 0 = use global
             "created": datetime.now(timezone.utc).isoformat(),
         }
-        self._config["api_keys"] = keys
-        self._save()
+        self._token_index[full_key] = key_id
+        self._save("api_keys")
         return key_id, full_key
 
     def delete_api_key(self, key_id):
         """Delete an API key. Returns True if found."""
-        keys = self._config.get("api_keys", {})
+        keys = self._config["api_keys"]
         if key_id in keys:
-            del keys[key_id]
-            self._config["api_keys"] = keys
-            self._save()
+            self._token_index.pop(keys.pop(key_id).get("key"), None)
+            self._save("api_keys")
             return True
         return False
 
     def get_key_by_token(self, token):
         """Look up API key config by the bearer token. Returns (key_id, key_config) or (None, None)."""
-        for key_id, key_config in self.api_keys.items():
-            if key_config.get("key") == token:
-                return key_id, key_config
-        return None, None
+        key_id = self._token_index.get(token)
+        if key_id is None:
+            return None, None
+        return key_id, self.api_keys[key_id]
 
     def list_api_keys(self):
         """Return list of API keys (with token masked)."""
@@ -352,8 +621,8 @@ class ConfigManager:
 
     def create_schedule(self, name, start, end, days=None, timezone_str="auto"):
         """Create a named schedule. Returns schedule_id."""
-        schedule_id = "sch_" + "".join(secrets.choice(string.ascii_lowercase + string.digits) for _ in range(6))
-        schedules = self._config.get("schedules", {})
+        schedules = self._config["schedules"]
+        schedule_id = _new_id("sch_", 3, schedules)
         schedules[schedule_id] = {
             "name": str(name)[:100],
             "start": start,  # "HH:MM"
@@ -361,46 +630,44 @@ class ConfigManager:
             "days": days if days is not None else [0, 1, 2, 3, 4, 5, 6],  # 0=Mon..6=Sun
             "timezone": timezone_str,
         }
-        self._config["schedules"] = schedules
-        self._save()
+        self._schedule_cache.pop(schedule_id, None)
+        self._save("schedules")
         return schedule_id
 
     def delete_schedule(self, schedule_id):
         """Delete a schedule and unassign from all entities."""
-        schedules = self._config.get("schedules", {})
+        schedules = self._config["schedules"]
         if schedule_id not in schedules:
             return False
         del schedules[schedule_id]
+        self._schedule_cache.pop(schedule_id, None)
         # Remove from entity_schedules
-        entity_schedules = self._config.get("entity_schedules", {})
-        self._config["entity_schedules"] = {
-            eid: sid for eid, sid in entity_schedules.items() if sid != schedule_id
-        }
-        self._config["schedules"] = schedules
-        self._save()
+        entity_schedules = self._config["entity_schedules"]
+        for eid in [eid for eid, sid in entity_schedules.items() if sid == schedule_id]:
+            del entity_schedules[eid]
+        self._save("schedules", "entity_schedules")
         return True
 
     def update_schedule(self, schedule_id, **kwargs):
         """Update schedule fields."""
-        schedules = self._config.get("schedules", {})
+        schedules = self._config["schedules"]
         if schedule_id not in schedules:
             return False
         for key in ("name", "start", "end", "days", "timezone"):
             if key in kwargs:
                 schedules[schedule_id][key] = kwargs[key]
-        self._config["schedules"] = schedules
-        self._save()
+        self._schedule_cache.pop(schedule_id, None)
+        self._save("schedules")
         return True
 
     def set_entity_schedule(self, entity_id, schedule_id):
         """Assign a schedule to an entity. None to remove."""
-        entity_schedules = self._config.get("entity_schedules", {})
+        entity_schedules = self._config["entity_schedules"]
         if schedule_id:
             entity_schedules[entity_id] = schedule_id
         else:
             entity_schedules.pop(entity_id, None)
-        self._config["entity_schedules"] = entity_schedules
-        self._save()
+        self._save("entity_schedules")
 
     def is_within_schedule(self, entity_id):
         """Check if current time is within the entity's schedule.
@@ -410,31 +677,27 @@ class ConfigManager:
         schedule_id = self.entity_schedules.get(entity_id)
         if not schedule_id:
             return True  # No schedule = always allowed
-        schedule = self.schedules.get(schedule_id)
-        if not schedule:
-            return True  # Schedule deleted
-
-        now = datetime.now()
-        current_day = now.weekday()  # 0=Monday
-        allowed_days = schedule.get("days", [0, 1, 2, 3, 4, 5, 6])
-        if current_day not in allowed_days:
+        parsed = self._schedule_cache.get(schedule_id)
+        if parsed is None:
+            schedule = self.schedules.get(schedule_id)
+            if not schedule:
+                return True  # Schedule deleted
+            parsed = self._schedule_cache[schedule_id] = _parse_schedule(schedule)
+        allowed_days, start_minutes, end_minutes = parsed
+
+        now = time.localtime()
+        if now.tm_wday not in allowed_days:  # 0=Monday
             return False
-
-        try:
-            start_h, start_m = map(int, schedule["start"].split(":"))
-            end_h, end_m = map(int, schedule["end"].split(":"))
-            start_minutes = start_h * 60 + start_m
-            end_minutes = end_h * 60 + end_m
-            current_minutes = now.hour * 60 + now.minute
-
-            if start_minutes <= end_minutes:
-                return start_minutes <= current_minutes <= end_minutes
-            else:
-                # Wraps midnight (e.g., 22:00 - 06:00)
-                return current_minutes >= start_minutes or current_minutes <= end_minutes
-        except (ValueError, KeyError):
+        if start_minutes is None:
             return True  # Malformed schedule = allow
 
+        current_minutes = now.tm_hour * 60 + now.tm_min
+        if start_minutes <= end_minutes:
+            return start_minutes <= current_minutes <= end_minutes
+        else:
+            # Wraps midnight (e.g., 22:00 - 06:00)
+            return current_minutes >= start_minutes or current_minutes <= end_minutes
+
     # ── Confirmation settings ─────────────────────
 
     @property
@@ -443,8 +706,7 @@ class ConfigManager:
 
     @confirm_timeout_seconds.setter
     def confirm_timeout_seconds(self, value):
-        self._config["confirm_timeout_seconds"] = max(10, min(600, int(value)))
-        self._save()
+        self._set("confirm_timeout_seconds", max(10, min(600, int(value))))
 
     @property
     def confirm_notify_service(self):
@@ -452,8 +714,7 @@ class ConfigManager:
 
     @confirm_notify_service.setter
     def confirm_notify_service(self, value):
-        self._config["confirm_notify_service"] = str(value).strip()
-        self._save()
+        self._set("confirm_notify_service", str(value).strip())
 
     @property
     def ai_name(self):
@@ -461,8 +722,7 @@ class ConfigManager:
 
     @ai_name.setter
     def ai_name(self, value):
-        self._config["ai_name"] = str(value)[:50].strip() if value else "AI"
-        self._save()
+        self._set("ai_name", str(value)[:50].strip() if value else "AI")
 
     # ── Entity Groups ──────────────────────────────
 
@@ -473,22 +733,19 @@ class ConfigManager:
 
     def create_group(self, name, entities=None, icon=""):
         """Create a new entity group. Returns group_id."""
-        group_id = "grp_" + "".join(
-            secrets.choice(string.ascii_lowercase + string.digits) for _ in range(6)
-        )
-        groups = self._config.get("entity_groups", {})
+        groups = self._config["entity_groups"]
+        group_id = _new_id("grp_", 3, groups)
         groups[group_id] = {
             "name": str(name)[:100],
             "entities": list(entities) if entities else [],
             "icon": str(icon)[:10] if icon else "",
         }
-        self._config["entity_groups"] = groups
-        self._save()
+        self._save("entity_groups")
         return group_id
 
     def update_group(self, group_id, **kwargs):
         """Update group fields (name, entities, icon)."""
-        groups = self._config.get("entity_groups", {})
+        groups = self._config["entity_groups"]
         if group_id not in groups:
             return False
         for key in ("name", "entities", "icon"):
@@ -499,17 +756,15 @@ class ConfigManager:
                     groups[group_id][key] = list(kwargs[key])
                 elif key == "icon":
                     groups[group_id][key] = str(kwargs[key])[:10]
-        self._config["entity_groups"] = groups
-        self._save()
+        self._save("entity_groups")
         return True
 
     def delete_group(self, group_id):
         """Delete an entity group. Returns True if found."""
-        groups = self._config.get("entity_groups", {})
+        groups = self._config["entity_groups"]
         if group_id in groups:
             del groups[group_id]
-            self._config["entity_groups"] = groups
-            self._save()
+            self._save("entity_groups")
             return True
         return False
 
@@ -519,23 +774,26 @@ class ConfigManager:
         """
         if access_level not in VALID_ACCESS_LEVELS and access_level != "off":
             return 0
-        groups = self._config.get("entity_groups", {})
+        groups = self._config["entity_groups"]
         group = groups.get(group_id)
         if not group:
             return 0
 
-        exposed = self._config.get("exposed_entities", {})
+        exposed = self._config["exposed_entities"]
         count = 0
         for eid in group.get("entities", []):
+            # Groups are stored as given; only string ids can be exposed
+            if not eid or not isinstance(eid, str):
+                continue
             if access_level == "off":
                 if eid in exposed:
-                    del exposed[eid]
+                    self._index_entity(eid, exposed.pop(eid), None)
                     count += 1
             else:
+                self._index_entity(eid, exposed.get(eid), access_level)
                 exposed[eid] = access_level
                 count += 1
-        self._config["exposed_entities"] = exposed
-        self._save()
+        self._save("exposed_entities")
         return count
 
     # ── Presets ────────────────────────────────────
@@ -546,18 +804,17 @@ class ConfigManager:
 
     def save_preset(self, name, entities):
         """Save a named preset (stores the full exposed_entities dict)."""
-        if "presets" not in self._config:
-            self._config["presets"] = {}
+        presets = self._config["presets"]
         # Accept both list (legacy) and dict (new format)
         if isinstance(entities, dict):
-            self._config["presets"][name] = entities
+            presets[name] = entities
         else:
             # Legacy list format: snapshot current access levels
-            current = self.exposed_entities
-            self._config["presets"][name] = {
+            current = self._config["exposed_entities"]
+            presets[name] = {
                 eid: current.get(eid, "read") for eid in entities if isinstance(eid, str)
             }
-        self._save()
+        self._save("presets")
 
     def load_preset(self, name):
         """Load a named preset. Returns dict or list (legacy) or None."""
@@ -565,9 +822,9 @@ class ConfigManager:
 
     def delete_preset(self, name):
         """Delete a named preset."""
-        if name in self._config.get("presets", {}):
+        if name in self._config["presets"]:
             del self._config["presets"][name]
-            self._save()
+            self._save("presets")
             return True
         return False
 
@@ -579,8 +836,7 @@ class ConfigManager:
 
     @refresh_interval.setter
     def refresh_interval(self, value):
-        self._config["refresh_interval"] = max(1, min(3600, int(value)))
-        self._save()
+        self._set("refresh_interval", max(1, min(3600, int(value))))
 
     @property
     def filter_unavailable(self):
@@ -588,8 +844,7 @@ class ConfigManager:
 
     @filter_unavailable.setter
     def filter_unavailable(self, value):
-        self._config["filter_unavailable"] = bool(value)
-        self._save()
+        self._set("filter_unavailable", bool(value))
 
     @property
     def compact_mode(self):
@@ -597,8 +852,7 @@ class ConfigManager:
 
     @compact_mode.setter
     def compact_mode(self, value):
-        self._config["compact_mode"] = bool(value)
-        self._save()
+        self._set("compact_mode", bool(value))
 
     # ── Security settings ─────────────────────────
 
@@ -608,8 +862,7 @@ class ConfigManager:
 
     @audit_enabled.setter
     def audit_enabled(self, value):
-        self._config["audit_enabled"] = bool(value)
-        self._save()
+        self._set("audit_enabled", bool(value))
 
     @property
     def audit_retention_days(self):
@@ -617,8 +870,7 @@ class ConfigManager:
 
     @audit_retention_days.setter
     def audit_retention_days(self, value):
-        self._config["audit_retention_days"] = max(1, min(365, int(value)))
-        self._save()
+        self._set("audit_retention_days", max(1, min(365, int(value))))
 
     @property
     def rate_limit_per_minute(self):
@@ -626,8 +878,7 @@ class ConfigManager:
 
     @rate_limit_per_minute.setter
     def rate_limit_per_minute(self, value):
-        self._config["rate_limit_per_minute"] = max(1, min(600, int(value)))
-        self._save()
+        self._set("rate_limit_per_minute", max(1, min(600, int(value))))
 
     @property
     def allowed_ips(self):
@@ -637,8 +888,13 @@ class ConfigManager:
     def allowed_ips(self, value):
         if not isinstance(value, list):
             value = []
-        self._config["allowed_ips"] = [ip for ip in value if isinstance(ip, str) and ip.strip()]
-        self._save()
+        self._set("allowed_ips", [ip for ip in value if type(ip) is str and ip.strip()])
+        self._allowed_ip_set = frozenset(self.allowed_ips)
+
+    @property
+    def allowed_ip_set(self):
+        """allowed_ips as a frozenset (empty means every address is allowed)."""
+        return self._allowed_ip_set
 
     # ── Export / Import ───────────────────────────
 
@@ -646,7 +902,78 @@ class ConfigManager:
         """Export full config as dict for backup."""
         return dict(self._config)
 
+    def export_config_pretty(self):
+        """Export full config as indented JSON bytes for download."""
+        return fast_json.dumps(self._config, indent=True)
+
     def import_config(self, data):
         """Import config from dict."""
         self._config.update(data)
+        self._ensure_keys()
+        self._schedule_cache.clear()
+        self._constraint_cache.clear()
+        self._rebuild_token_index()
+        self._allowed_ip_set = frozenset(self.allowed_ips)
+        self._rebuild_exposed_indexes()
         self._save()
+
+
+def _fsync_dir(path):
+    """fsync a directory so renames inside it are durable."""
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _read_config_file(path):
+    """Parse one config file into a dict. Returns None if it doesn't exist
+    and {} if it is empty or unreadable.
+    """
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        return None
+    # Empty file or "{}": nothing to parse
+    if size < 3:
+        return {}
+    try:
+        with open(path, "rb") as f:
+            if size > MMAP_LOAD_THRESHOLD:
+                # Parse straight from the mapping instead of copying it into bytes
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as view:
+                        data = fast_json.loads(view)
+            else:
+                data = fast_json.loads(f.read())
+    except Exception as e:
+        logger.error("Failed to load config %s: %s", path, e)
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _new_id(prefix, nbytes, existing):
+    """Random ID of prefix + 2*nbytes hex chars, not already a key of existing."""
+    while True:
+        new_id = prefix + secrets.token_hex(nbytes)
+        if new_id not in existing:
+            return new_id
+
+
+def _parse_schedule(schedule):
+    """Parse a schedule into (allowed weekdays, start minute, end minute).
+    Start and end are None if the times are malformed.
+    """
+    days = schedule.get("days")
+    if isinstance(days, list):
+        # days comes straight from the request body; ignore anything but weekday ints
+        allowed_days = frozenset(d for d in days if type(d) is int)
+    else:
+        allowed_days = ALL_WEEKDAYS
+    try:
+        start_h, start_m = map(int, schedule["start"].split(":"))
+        end_h, end_m = map(int, schedule["end"].split(":"))
+    except (ValueError, KeyError, AttributeError):
+        return allowed_days, None, None
+    return allowed_days, start_h * 60 + start_m, end_h * 60 + end_m
@@ -0,0 +1,50 @@
+"""JSON helpers for ClawBridge.
+
+Uses orjson when it is installed (it ships in the add-on image) and falls
+back to the stdlib json module otherwise. Encoders always return bytes.
+"""
+
+import json
+from datetime import date, datetime
+from types import MappingProxyType
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so one except clause covers both
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data):
+    """Parse JSON from bytes, bytearray, memoryview or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def dumps(obj, indent=False):
+    """Serialize obj to JSON bytes. datetime values become ISO 8601 strings
+    and read-only mapping views are encoded like the dicts behind them.
+
+    Output is compact unless indent is set, which indents by two spaces.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+    if indent:
+        return json.dumps(obj, indent=2, default=_default).encode()
+    return json.dumps(obj, separators=(",", ":"), default=_default).encode()
+
+
+def _default(obj):
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -6,17 +6,70 @@ Uses the Supervisor API token for authentication.
 """
 
 import asyncio
-import json
+import bisect
 import logging
 import os
+import random
+import time
 from datetime import datetime, timezone
 
 import aiohttp
 
+import fast_json
+
 logger = logging.getLogger(__name__)
 
 HA_URL = "http://supervisor/core"
+STATES_URL = f"{HA_URL}/api/states"
+TEMPLATE_URL = f"{HA_URL}/api/template"
+SERVICES_URL = f"{HA_URL}/api/services"
+HISTORY_URL = f"{HA_URL}/api/history/period"
 HA_WS_URL = "ws://supervisor/core/websocket"
+ADDON_INFO_URL = "http://supervisor/addons/self/info"
+
+# HTTP pool towards the Supervisor proxy. Everything goes to one host, so the
+# per-host limit is the real cap; idle connections are kept as long as HA's
+# own server keeps them (75s)
+HTTP_POOL_SIZE = 64
+HTTP_KEEPALIVE_SECONDS = 75
+# Service calls can legitimately run for minutes (scripts, return_response),
+# so only connecting is bounded tightly
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=300, sock_connect=10)
+# Ping interval that lets a silently dropped WebSocket be noticed
+WS_HEARTBEAT_SECONDS = 30
+# Reconnect delays double from 2s up to this cap, plus up to 1s of jitter
+WS_RECONNECT_MAX_SECONDS = 60
+# Wait before reconnecting after an authenticated connection drops
+WS_RECONNECT_BASE_SECONDS = 1
+
+# Area ids with their names and member entities, rendered in one template call
+AREAS_TEMPLATE = (
+    '{% set ids = areas() | list %}'
+    '{{ {"ids": ids, "names": ids | map("area_name") | list,'
+    ' "entities": ids | map("area_entities") | list} | tojson }}'
+)
+# Events allowed to queue for the callbacks before the WebSocket reader waits
+MAX_PENDING_CALLBACKS = 256
+# Attributes copied into the AI sensor entries when present
+EXTRA_ATTRIBUTE_KEYS = ("battery_level", "temperature", "humidity", "brightness", "color_temp")
+# States dropped when filter_unavailable is on
+UNAVAILABLE_STATES = frozenset({"unavailable", "unknown"})
+# Attributes get_all_entities() reports as fields rather than in attribute_keys
+_LISTED_ATTRIBUTE_KEYS = frozenset({"friendly_name", "icon", "device_class", "unit_of_measurement"})
+# Context reported for states that arrive without one
+_EMPTY_CONTEXT = {"id": "", "parent_id": None, "user_id": None}
+# Request bodies are encoded with fast_json and posted as raw bytes
+JSON_HEADERS = {"Content-Type": "application/json"}
+AREAS_TEMPLATE_BODY = fast_json.dumps({"template": AREAS_TEMPLATE})
+# Registry events after which the area maps are reloaded
+REGISTRY_EVENTS = ("area_registry_updated", "device_registry_updated", "entity_registry_updated")
+# Registry events come in bursts (e.g. while an integration loads); wait this
+# long after the first one before reloading
+AREA_RELOAD_DELAY_SECONDS = 2
+# Fallback polling (WebSocket down) slows down once the states have gone
+# unread this long, doubling per idle period up to the cap
+POLL_IDLE_AFTER_SECONDS = 60
+POLL_MAX_INTERVAL_SECONDS = 300
 
 
 def _get_token():
@@ -33,44 +86,97 @@ class HAClient:
     def __init__(self):
         self._states = {}
         self._previous_states = {}
+        # get_all_entities() result (domain -> entries sorted by name) and
+        # entity_id -> its entry; built on first use and patched as states change
+        self._entities_by_domain = None
+        self._entity_entries = {}
+        # entity_id -> state in HA's /api/states shape, built on first request
+        self._ha_format = {}
+        # entity_id -> full AI sensor entry, built on first request; shared
+        # between responses, so never modified once built
+        self._sensor_entries = {}
+        # Entities whose state is not in UNAVAILABLE_STATES
+        self._available_ids = set()
+        # Bumped whenever a state or the area maps change
+        self._revision = 0
         self._areas = {}
-        self._entity_registry = {}
-        self._device_registry = {}
+        self._entity_area = {}  # entity_id -> area name
+        self._area_reload_task = None
         self._session = None
+        # Ingress URL of this add-on, looked up from the Supervisor at start
+        self.ingress_url = ""
         # WebSocket
         self._ws = None
         self._ws_task = None
+        self._stopping = False
         self._ws_msg_id = 1
         self._ws_pending = {}  # msg_id -> Future for request/response commands
-        self._state_change_callbacks = []
-        self._notification_action_callbacks = []
+        # Callbacks in subscription order (dicts used as ordered sets)
+        self._state_change_callbacks = {}
+        self._notification_action_callbacks = {}
+        # Events waiting for their callbacks, run in arrival order by one consumer
+        self._callback_queue = asyncio.Queue(MAX_PENDING_CALLBACKS)
+        self._callback_task = None
         self._ws_connected = False
+        # time.monotonic() when the WebSocket was last lost (or the client created)
+        self._ws_down_since = time.monotonic()
+        # time.monotonic() of the last read of the cached states
+        self._last_access = time.monotonic()
 
     async def start(self):
         """Initialize the HTTP session."""
         token = _get_token()
-        logger.info("Supervisor token present: %s (length: %d)", bool(token), len(token))
+        logger.debug("Supervisor token present: %s", bool(token))
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            limit_per_host=HTTP_POOL_SIZE,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+            ttl_dns_cache=300,
+        )
         self._session = aiohttp.ClientSession(
-            headers={"Authorization": f"Bearer {token}"}
+            headers={"Authorization": f"Bearer {token}"},
+            connector=connector,
+            timeout=HTTP_TIMEOUT,
+        )
+        # Independent requests; each one only replaces the state it owns
+        await asyncio.gather(
+            self._fetch_ingress_url(),
+            self._load_areas(),
+            self.refresh_states(),
         )
-        await self._load_areas()
-        await self._load_entity_registry()
-        await self._load_device_registry()
-        await self.refresh_states()
         logger.info("HA Client started, loaded %d entities", len(self._states))
+        self._callback_task = asyncio.create_task(self._callback_consumer())
         # Start WebSocket connection for real-time updates
         self._ws_task = asyncio.create_task(self._ws_listener())
 
+    async def _fetch_ingress_url(self):
+        """Fetch this add-on's ingress URL from the Supervisor API."""
+        try:
+            async with self._session.get(ADDON_INFO_URL) as resp:
+                if resp.status == 200:
+                    data = fast_json.loads(await resp.read())
+                    self.ingress_url = data.get("data", {}).get("ingress_url", "")
+                    logger.info("Ingress URL from Supervisor: %s", self.ingress_url)
+                else:
+                    body = await resp.text()
+                    logger.warning("Failed to get addon info: HTTP %d - %s", resp.status, body)
+        except Exception as e:
+            logger.warning("Failed to fetch ingress URL: %s", e)
+
     async def stop(self):
         """Close the HTTP session and WebSocket."""
+        self._stopping = True
+        if self._area_reload_task and not self._area_reload_task.done():
+            self._area_reload_task.cancel()
         if self._ws_task:
             self._ws_task.cancel()
             try:
                 await self._ws_task
             except asyncio.CancelledError:
                 pass
-        if self._ws:
-            await self._ws.close()
+        if self._callback_task:
+            self._callback_task.cancel()
+        # The listener's `async with` has already closed the WebSocket
         if self._session:
             await self._session.close()
 
@@ -79,22 +185,36 @@ class HAClient:
     async def _ws_listener(self):
         """Maintain a persistent WebSocket connection to HA for state_changed events."""
         token = _get_token()
-        while True:
+        # start() has just loaded the states; only reconnects need a resync
+        resync = False
+        # Failed attempts since the last authenticated connection
+        failures = 0
+        first_attempt = True
+        while not self._stopping:
+            if not first_attempt:
+                # A dropped authenticated connection still waits, so a
+                # restarting HA isn't hammered by every client at once
+                base = min(WS_RECONNECT_MAX_SECONDS, 2 ** failures) if failures else WS_RECONNECT_BASE_SECONDS
+                delay = base + random.uniform(0, 1)
+                logger.info("Reconnecting WebSocket in %.1fs", delay)
+                await asyncio.sleep(delay)
+            first_attempt = False
+            failures += 1
             try:
-                async with self._session.ws_connect(HA_WS_URL) as ws:
+                async with self._session.ws_connect(HA_WS_URL, heartbeat=WS_HEARTBEAT_SECONDS) as ws:
                     self._ws = ws
                     logger.info("WebSocket connected to HA")
 
                     # HA sends auth_required first
-                    msg = await ws.receive_json()
+                    msg = await ws.receive_json(loads=fast_json.loads)
                     if msg.get("type") == "auth_required":
                         await ws.send_json({"type": "auth", "access_token": token})
-                        auth_result = await ws.receive_json()
+                        auth_result = await ws.receive_json(loads=fast_json.loads)
                         if auth_result.get("type") != "auth_ok":
                             logger.error("WebSocket auth failed: %s", auth_result)
-                            await asyncio.sleep(10)
                             continue
 
+                    failures = 0
                     self._ws_connected = True
                     logger.info("WebSocket authenticated with HA")
 
@@ -115,13 +235,27 @@ class HAClient:
                         "type": "subscribe_events",
                         "event_type": "mobile_app_notification_action",
                     })
-                    logger.info("Subscribed to state_changed and mobile_app_notification_action events")
+
+                    # Subscribe to registry changes that can move entities between areas
+                    for event_type in REGISTRY_EVENTS:
+                        await ws.send_json({
+                            "id": self._ws_msg_id,
+                            "type": "subscribe_events",
+                            "event_type": event_type,
+                        })
+                        self._ws_msg_id += 1
+                    logger.info("Subscribed to state_changed, mobile_app_notification_action and registry events")
+
+                    # Catch up on changes missed while disconnected
+                    if resync:
+                        await self.refresh_states()
+                    resync = True
 
                     async for raw_msg in ws:
                         if raw_msg.type == aiohttp.WSMsgType.TEXT:
                             try:
-                                data = json.loads(raw_msg.data)
-                            except json.JSONDecodeError:
+                                data = fast_json.loads(raw_msg.data)
+                            except fast_json.JSONDecodeError:
                                 continue
 
                             msg_type = data.get("type")
@@ -159,22 +293,31 @@ class HAClient:
                                             if old_cached.get("state") != new_state.get("state"):
                                                 self._previous_states[entity_id] = old_cached.get("state")
                                         self._states[entity_id] = new_state
+                                        self._on_state_stored(entity_id, new_state)
 
                                         # Notify callbacks
-                                        for callback in self._state_change_callbacks:
-                                            try:
-                                                await callback(entity_id, new_state, old_state)
-                                            except Exception as e:
-                                                logger.error("State change callback error: %s", e)
+                                        await self._dispatch(
+                                            self._state_change_callbacks,
+                                            (entity_id, new_state, old_state),
+                                            "State change",
+                                        )
+                                    elif entity_id:
+                                        # Entity removed; polling no longer prunes it while connected
+                                        self._states.pop(entity_id, None)
+                                        self._previous_states.pop(entity_id, None)
+                                        self._on_state_stored(entity_id, None)
 
                                 elif event_type == "mobile_app_notification_action":
                                     action_str = event_data.get("action", "")
                                     if action_str.startswith("CLAWBRIDGE_"):
-                                        for callback in self._notification_action_callbacks:
-                                            try:
-                                                await callback(action_str, event_data)
-                                            except Exception as e:
-                                                logger.error("Notification action callback error: %s", e)
+                                        await self._dispatch(
+                                            self._notification_action_callbacks,
+                                            (action_str, event_data),
+                                            "Notification action",
+                                        )
+
+                                elif event_type in REGISTRY_EVENTS:
+                                    self._schedule_area_reload()
 
                         elif raw_msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
                             break
@@ -182,8 +325,10 @@ class HAClient:
             except asyncio.CancelledError:
                 raise
             except Exception as e:
-                logger.warning("WebSocket connection lost: %s. Reconnecting in 5s...", e)
+                logger.warning("WebSocket connection lost: %s", e)
             finally:
+                if self._ws_connected:
+                    self._ws_down_since = time.monotonic()
                 self._ws_connected = False
                 self._ws = None
                 # Cancel any pending command futures
@@ -192,8 +337,6 @@ class HAClient:
                         future.set_result(None)
                 self._ws_pending.clear()
 
-            await asyncio.sleep(5)
-
     async def _ws_send_command(self, command, timeout=30):
         """Send a WebSocket command and wait for the result.
 
@@ -229,21 +372,53 @@ class HAClient:
         finally:
             self._ws_pending.pop(msg_id, None)
 
+    async def _dispatch(self, callbacks, args, label):
+        """Queue an event for its callbacks so a slow one never stalls the
+        WebSocket reader. Once MAX_PENDING_CALLBACKS events are queued,
+        waits for room.
+        """
+        if callbacks:
+            # Snapshot: waiting below can let a (un)subscribe change the dict
+            await self._callback_queue.put((tuple(callbacks), args, label))
+
+    async def _callback_consumer(self):
+        """Run queued callbacks one at a time, so events reach them (and the
+        clients they forward to) in the order HA sent them.
+        """
+        while True:
+            callbacks, args, label = await self._callback_queue.get()
+            for callback in callbacks:
+                try:
+                    await callback(*args)
+                except Exception as e:
+                    logger.error("%s callback error: %s", label, e)
+
     def subscribe_state_changes(self, callback):
-        """Register a callback for state changes: async callback(entity_id, new_state, old_state)."""
-        self._state_change_callbacks.append(callback)
+        """Register a callback for state changes: async callback(entity_id, new_state, old_state).
+        Returns a function that unregisters it.
+        """
+        self._state_change_callbacks[callback] = None
+        return lambda: self.unsubscribe_state_changes(callback)
 
     def unsubscribe_state_changes(self, callback):
         """Unregister a state change callback."""
-        self._state_change_callbacks = [cb for cb in self._state_change_callbacks if cb is not callback]
+        self._state_change_callbacks.pop(callback, None)
 
     def subscribe_notification_actions(self, callback):
-        """Register a callback for notification actions: async callback(action_str, event_data)."""
-        self._notification_action_callbacks.append(callback)
+        """Register a callback for notification actions: async callback(action_str, event_data).
+        Returns a function that unregisters it.
+        """
+        self._notification_action_callbacks[callback] = None
+        return lambda: self.unsubscribe_notification_actions(callback)
 
     def unsubscribe_notification_actions(self, callback):
         """Unregister a notification action callback."""
-        self._notification_action_callbacks = [cb for cb in self._notification_action_callbacks if cb is not callback]
+        self._notification_action_callbacks.pop(callback, None)
+
+    @property
+    def revision(self):
+        """Number that changes whenever cached states or areas do, for keying caches."""
+        return self._revision
 
     @property
     def ws_connected(self):
@@ -253,198 +428,196 @@ class HAClient:
     # ── Area / Registry loading ───────────────────
 
     async def _load_areas(self):
-        """Load area registry from HA."""
-        try:
-            async with self._session.get(f"{HA_URL}/api/config") as resp:
-                if resp.status == 200:
-                    pass
-        except Exception as e:
-            logger.warning("Failed to load areas: %s", e)
-
+        """Load area names and the entity -> area mapping from HA in one template call."""
         try:
             async with self._session.post(
-                f"{HA_URL}/api/template",
-                json={"template": "{{ areas() | list }}"},
+                TEMPLATE_URL,
+                data=AREAS_TEMPLATE_BODY,
+                headers=JSON_HEADERS,
             ) as resp:
-                if resp.status == 200:
-                    text = await resp.text()
-                    area_ids = json.loads(text.replace("'", '"'))
-                    for area_id in area_ids:
-                        async with self._session.post(
-                            f"{HA_URL}/api/template",
-                            json={"template": f"{{{{ area_name('{area_id}') }}}}"},
-                        ) as name_resp:
-                            if name_resp.status == 200:
-                                name = await name_resp.text()
-                                self._areas[area_id] = name.strip()
+                if resp.status != 200:
+                    logger.warning("Failed to load areas: HTTP %d", resp.status)
+                    return
+                data = fast_json.loads(await resp.read())
+            areas = {}
+            entity_area = {}
+            for area_id, name, entity_ids in zip(data["ids"], data["names"], data["entities"]):
+                areas[area_id] = name
+                for entity_id in entity_ids:
+                    entity_area[entity_id] = name
         except Exception as e:
-            logger.warning("Failed to load area names: %s", e)
-
-    async def _load_entity_registry(self):
-        """Load entity-to-area mappings via template API."""
-        try:
-            async with self._session.get(f"{HA_URL}/api/states") as resp:
-                if resp.status == 200:
-                    states = await resp.json()
-                    for state in states:
-                        entity_id = state.get("entity_id", "")
-                        self._entity_registry[entity_id] = {
-                            "entity_id": entity_id,
-                        }
-        except Exception as e:
-            logger.warning("Failed to load entity registry: %s", e)
-
-    async def _load_device_registry(self):
-        """Placeholder for device registry loading."""
-        pass
-
-    async def _get_entity_area(self, entity_id):
-        """Get the area name for an entity using template API."""
-        try:
-            async with self._session.post(
-                f"{HA_URL}/api/template",
-                json={"template": f"{{{{ area_name('{entity_id}') }}}}"},
-            ) as resp:
-                if resp.status == 200:
-                    area = (await resp.text()).strip()
-                    if area and area != "None" and area != "":
-                        return area
-        except Exception:
-            pass
-        return None
+            # Includes a reply that isn't the shape AREAS_TEMPLATE renders
+            logger.warning("Failed to load areas: %s", e)
+            return
+
+        if areas == self._areas and entity_area == self._entity_area:
+            # Nothing moved; keep the caches that depend on the area maps
+            return
+        self._areas = areas
+        self._entity_area = entity_area
+        # Sensor entries carry the area name
+        self._sensor_entries.clear()
+        self._revision += 1
+        logger.debug("Loaded %d areas covering %d entities", len(areas), len(entity_area))
+
+    def _schedule_area_reload(self):
+        """Reload the area maps shortly, unless a reload is already pending."""
+        if self._area_reload_task is None or self._area_reload_task.done():
+            self._area_reload_task = asyncio.create_task(self._reload_areas_later())
+
+    async def _reload_areas_later(self):
+        await asyncio.sleep(AREA_RELOAD_DELAY_SECONDS)
+        await self._load_areas()
 
     async def get_entities_by_area(self):
         """Return a dict of area_name -> [entity_id, ...] for all entities with an area.
 
-        Uses a single HA template call to fetch all entity-area mappings in bulk.
+        Reloads the area maps (a single template call) so the result is current.
         """
-        template = (
-            '[{% for state in states %}'
-            '{% set a = area_name(state.entity_id) %}'
-            '{% if a and a != "None" %}'
-            '{"e":"{{ state.entity_id }}","a":"{{ a }}"},'
-            '{% endif %}'
-            '{% endfor %}]'
-        )
-        try:
-            async with self._session.post(
-                f"{HA_URL}/api/template",
-                json={"template": template},
-            ) as resp:
-                if resp.status == 200:
-                    text = await resp.text()
-                    # Remove trailing comma before closing bracket
-                    text = text.strip()
-                    if text.endswith(",]"):
-                        text = text[:-2] + "]"
-                    pairs = json.loads(text)
-                    areas = {}
-                    for pair in pairs:
-                        area = pair["a"]
-                        eid = pair["e"]
-                        if area not in areas:
-                            areas[area] = []
-                        areas[area].append(eid)
-                    # Sort entity lists
-                    for area in areas:
-                        areas[area].sort()
-                    return areas
-        except Exception as e:
-            logger.warning("Failed to load entities by area: %s", e)
-        return {}
+        await self._load_areas()
+        areas = {}
+        states = self._states
+        for entity_id, area in self._entity_area.items():
+            # Registry entries without a state (e.g. disabled entities) are skipped
+            if entity_id not in states:
+                continue
+            if area not in areas:
+                areas[area] = []
+            areas[area].append(entity_id)
+        # Sort entity lists
+        for area in areas:
+            areas[area].sort()
+        return areas
 
     # ── State management ──────────────────────────
 
     async def refresh_states(self):
         """Fetch all current entity states from HA."""
         try:
-            async with self._session.get(f"{HA_URL}/api/states") as resp:
+            async with self._session.get(STATES_URL) as resp:
                 if resp.status == 200:
-                    states = await resp.json()
-                    new_states = {}
+                    states = fast_json.loads(await resp.read())
+                    # Update the cached dict in place, touching only entries that changed
+                    cached_states = self._states
+                    seen = set()
                     for state in states:
                         entity_id = state.get("entity_id", "")
-                        if entity_id in self._states:
-                            old = self._states[entity_id]
+                        seen.add(entity_id)
+                        old = cached_states.get(entity_id)
+                        if old is not None:
+                            if old.get("last_updated") == state.get("last_updated"):
+                                continue
                             if old.get("state") != state.get("state"):
                                 self._previous_states[entity_id] = old.get("state")
-                        new_states[entity_id] = state
-                    self._states = new_states
-                    logger.debug("Refreshed %d entity states", len(self._states))
+                        cached_states[entity_id] = state
+                        self._on_state_stored(entity_id, state)
+                    if len(seen) != len(cached_states):
+                        for entity_id in [eid for eid in cached_states if eid not in seen]:
+                            del cached_states[entity_id]
+                            self._on_state_stored(entity_id, None)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Refreshed %d entity states", len(self._states))
                 else:
                     logger.error("Failed to fetch states: HTTP %d", resp.status)
         except Exception as e:
             logger.error("Error refreshing states: %s", e)
 
+    def mark_access(self):
+        """Record a read served from a caller's cache, so polling stays fast."""
+        self._last_access = time.monotonic()
+
     def get_all_entities(self):
-        """Return all entities grouped by domain."""
-        domains = {}
-        for entity_id, state in self._states.items():
-            domain = entity_id.split(".")[0]
-            if domain not in domains:
-                domains[domain] = []
-            attrs = state.get("attributes", {})
-            domains[domain].append({
-                "entity_id": entity_id,
-                "friendly_name": attrs.get("friendly_name", entity_id),
-                "state": state.get("state", "unknown"),
-                "domain": domain,
-                "device_class": attrs.get("device_class"),
-                "unit_of_measurement": attrs.get("unit_of_measurement"),
-                "icon": attrs.get("icon"),
-                "attribute_keys": [k for k in attrs.keys()
-                                   if k not in ("friendly_name", "icon",
-                                                "device_class",
-                                                "unit_of_measurement")],
-            })
-        for domain in domains:
-            domains[domain].sort(key=lambda e: e.get("friendly_name", "").lower())
-        return domains
+        """Return all entities grouped by domain, each domain sorted by name.
+
+        The result is cached and kept current as states change, so callers
+        must not modify it.
+        """
+        self._last_access = time.monotonic()
+        if self._entities_by_domain is None:
+            domains = {}
+            entries = {}
+            for entity_id, state in self._states.items():
+                domain = entity_id.partition(".")[0]
+                entry = entries[entity_id] = _entity_entry(entity_id, domain, state)
+                domains.setdefault(domain, []).append(entry)
+            for domain_entries in domains.values():
+                domain_entries.sort(key=_entity_sort_key)
+            self._entities_by_domain = domains
+            self._entity_entries = entries
+        return self._entities_by_domain
+
+    def _on_state_stored(self, entity_id, state):
+        """Keep the caches derived from self._states in step with it.
+        A state of None means the entity was removed.
+        """
+        self._revision += 1
+        self._ha_format.pop(entity_id, None)
+        self._sensor_entries.pop(entity_id, None)
+        if state is None or state.get("state", "unknown") in UNAVAILABLE_STATES:
+            self._available_ids.discard(entity_id)
+        else:
+            self._available_ids.add(entity_id)
+        self._patch_entity_entry(entity_id, state)
+
+    def _patch_entity_entry(self, entity_id, state):
+        """Bring the get_all_entities() cache up to date for one entity.
+        A state of None means the entity was removed.
+        """
+        domains = self._entities_by_domain
+        if domains is None:
+            return
+        domain = entity_id.partition(".")[0]
+        old = self._entity_entries.pop(entity_id, None)
+        new = None if state is None else _entity_entry(entity_id, domain, state)
+        if old is not None and new is not None and old["friendly_name"] == new["friendly_name"]:
+            # Same sort position: update the listed entry in place
+            old.update(new)
+            self._entity_entries[entity_id] = old
+            return
+        if old is not None:
+            # Entries keep their name while listed, so bisect finds the run of
+            # equal names and only that run is scanned for this entry
+            domain_entries = domains[domain]
+            index = bisect.bisect_left(
+                domain_entries, _entity_sort_key(old), key=_entity_sort_key
+            )
+            while domain_entries[index] is not old:
+                index += 1
+            del domain_entries[index]
+            if not domain_entries:
+                del domains[domain]
+        if new is not None:
+            self._entity_entries[entity_id] = new
+            bisect.insort(domains.setdefault(domain, []), new, key=_entity_sort_key)
 
     async def get_exposed_data(self, selected_entities, filter_unavailable=True, compact=False):
         """Get data for selected entities in the AI endpoint format."""
+        self._last_access = time.monotonic()
         sensors = []
-        now = datetime.now(timezone.utc).isoformat()
-
+        add = sensors.append
+        # Left as a datetime; fast_json writes it out as an ISO 8601 string
+        now = datetime.now(timezone.utc)
+
+        states = self._states
+        sensor_entries = self._sensor_entries
+        # Available entities are a subset of the known ones, so one membership test covers both
+        wanted = self._available_ids if filter_unavailable else states
         for entity_id in selected_entities:
-            if entity_id not in self._states:
-                continue
-
-            state = self._states[entity_id]
-            current_state = state.get("state", "unknown")
-
-            if filter_unavailable and current_state in ("unavailable", "unknown"):
+            if entity_id not in wanted:
                 continue
 
             if compact:
-                sensors.append({
+                add({
                     "entity_id": entity_id,
-                    "state": current_state,
+                    "state": states[entity_id].get("state", "unknown"),
                 })
             else:
-                attrs = state.get("attributes", {})
-                last_state = self._previous_states.get(entity_id, current_state)
-                area = await self._get_entity_area(entity_id)
-
-                entry = {
-                    "entity_id": entity_id,
-                    "friendly_name": attrs.get("friendly_name", entity_id),
-                    "state": current_state,
-                    "last_state": last_state,
-                    "last_changed": state.get("last_changed", now),
-                    "unit_of_measurement": attrs.get("unit_of_measurement"),
-                    "device_class": attrs.get("device_class"),
-                    "area": area,
-                }
-
-                extra_attrs = {}
-                for key in ("battery_level", "temperature", "humidity", "brightness", "color_temp"):
-                    if key in attrs:
-                        extra_attrs[key] = attrs[key]
-                if extra_attrs:
-                    entry["attributes"] = extra_attrs
-
-                sensors.append(entry)
+                entry = sensor_entries.get(entity_id)
+                if entry is None:
+                    entry = sensor_entries[entity_id] = self._build_sensor_entry(
+                        entity_id, states[entity_id], now
+                    )
+                add(entry)
 
         return {
             "sensors": sensors,
@@ -452,39 +625,64 @@ class HAClient:
             "total_sensors": len(sensors),
         }
 
+    def _build_sensor_entry(self, entity_id, state, now):
+        """Build the full (non-compact) AI sensor entry for one entity."""
+        current_state = state.get("state", "unknown")
+        attrs = state.get("attributes", {})
+        entry = {
+            "entity_id": entity_id,
+            "friendly_name": attrs.get("friendly_name", entity_id),
+            "state": current_state,
+            "last_state": self._previous_states.get(entity_id, current_state),
+            "last_changed": state.get("last_changed", now),
+            "unit_of_measurement": attrs.get("unit_of_measurement"),
+            "device_class": attrs.get("device_class"),
+            "area": self._entity_area.get(entity_id),
+        }
+
+        extra_attrs = {key: attrs[key] for key in EXTRA_ATTRIBUTE_KEYS if key in attrs}
+        if extra_attrs:
+            entry["attributes"] = extra_attrs
+        return entry
+
+    def _get_ha_format(self, entity_id):
+        """Cached HA-format state for entity_id, or None if unknown."""
+        entry = self._ha_format.get(entity_id)
+        if entry is None:
+            state = self._states.get(entity_id)
+            if state is None:
+                return None
+            entry = self._ha_format[entity_id] = {
+                "entity_id": entity_id,
+                "state": state.get("state", "unknown"),
+                "attributes": state.get("attributes", {}),
+                "last_changed": state.get("last_changed", ""),
+                "last_updated": state.get("last_updated", ""),
+                "context": state["context"] if "context" in state else dict(_EMPTY_CONTEXT),
+            }
+        return entry
+
     def get_ha_format_states(self, entity_ids, filter_unavailable=True):
-        """Return states in Home Assistant's exact /api/states JSON format for given entity_ids."""
+        """Return states in Home Assistant's exact /api/states JSON format for given entity_ids.
+        Each state is a fresh shallow copy the caller may add keys to.
+        """
+        self._last_access = time.monotonic()
         results = []
+        available = self._available_ids
         for entity_id in entity_ids:
-            if entity_id not in self._states:
+            if filter_unavailable and entity_id not in available:
                 continue
-            state = self._states[entity_id]
-            current = state.get("state", "unknown")
-            if filter_unavailable and current in ("unavailable", "unknown"):
+            entry = self._get_ha_format(entity_id)
+            if entry is None:
                 continue
-            results.append({
-                "entity_id": entity_id,
-                "state": current,
-                "attributes": state.get("attributes", {}),
-                "last_changed": state.get("last_changed", ""),
-                "last_updated": state.get("last_updated", ""),
-                "context": state.get("context", {"id": "", "parent_id": None, "user_id": None}),
-            })
+            results.append(entry.copy())
         return results
 
     def get_ha_format_single(self, entity_id):
-        """Return a single entity state in HA format, or None if not found."""
-        if entity_id not in self._states:
-            return None
-        state = self._states[entity_id]
-        return {
-            "entity_id": entity_id,
-            "state": state.get("state", "unknown"),
-            "attributes": state.get("attributes", {}),
-            "last_changed": state.get("last_changed", ""),
-            "last_updated": state.get("last_updated", ""),
-            "context": state.get("context", {"id": "", "parent_id": None, "user_id": None}),
-        }
+        """Return a single entity state in HA format (a fresh shallow copy), or None if not found."""
+        self._last_access = time.monotonic()
+        entry = self._get_ha_format(entity_id)
+        return None if entry is None else entry.copy()
 
     # ── History ───────────────────────────────────
 
@@ -500,10 +698,10 @@ class HAClient:
             if end_time:
                 params["end_time"] = end_time
 
-            url = f"{HA_URL}/api/history/period/{start_time}"
+            url = f"{HISTORY_URL}/{start_time}"
             async with self._session.get(url, params=params) as resp:
                 if resp.status == 200:
-                    return await resp.json()
+                    return fast_json.loads(await resp.read())
                 logger.warning("Failed to fetch history: HTTP %d", resp.status)
         except Exception as e:
             logger.warning("Failed to fetch history: %s", e)
@@ -540,9 +738,9 @@ class HAClient:
     async def get_services(self):
         """Fetch available HA services (domain -> list of service names). Returns dict."""
         try:
-            async with self._session.get(f"{HA_URL}/api/services") as resp:
+            async with self._session.get(SERVICES_URL) as resp:
                 if resp.status == 200:
-                    data = await resp.json()
+                    data = fast_json.loads(await resp.read())
                     return {item["domain"]: item.get("services", []) for item in data}
                 logger.warning("Failed to fetch services: HTTP %d", resp.status)
         except Exception as e:
@@ -556,14 +754,16 @@ class HAClient:
         returns the service response data (required for services like todo.get_items).
         """
         try:
-            url = f"{HA_URL}/api/services/{domain}/{service}"
+            url = f"{SERVICES_URL}/{domain}/{service}"
             if return_response:
                 url += "?return_response"
                 # Remove return_response from body if present (it's a query param, not body param)
                 service_data = {k: v for k, v in service_data.items() if k != "return_response"}
-            async with self._session.post(url, json=service_data) as resp:
+            async with self._session.post(
+                url, data=fast_json.dumps(service_data), headers=JSON_HEADERS
+            ) as resp:
                 if resp.status in (200, 201):
-                    return True, await resp.json()
+                    return True, fast_json.loads(await resp.read())
                 body = await resp.text()
                 logger.warning("Service call failed: %s/%s HTTP %d %s", domain, service, resp.status, body[:200])
                 return False, {"error": body or f"HTTP {resp.status}"}
@@ -572,7 +772,44 @@ class HAClient:
             return False, {"error": str(e)}
 
     async def periodic_refresh(self, interval=5):
-        """Background task to periodically refresh states."""
+        """Background task to periodically refresh states.
+
+        Polling only happens once the WebSocket has been down for a full
+        interval: while it is connected, state_changed events keep the cache
+        current, and the listener resyncs by itself after a quick reconnect.
+        While nothing reads the states, polls are spaced out exponentially;
+        the next read brings the interval back within one tick.
+        """
+        last_poll = time.monotonic()
         while True:
             await asyncio.sleep(interval)
-            await self.refresh_states()
+            now = time.monotonic()
+            if self._ws_connected or now - self._ws_down_since < interval:
+                continue
+            due = interval
+            idle_periods = int((now - self._last_access) // POLL_IDLE_AFTER_SECONDS)
+            if idle_periods:
+                due = min(interval * 2 ** min(idle_periods, 6), POLL_MAX_INTERVAL_SECONDS)
+            if now - last_poll >= due:
+                await self.refresh_states()
+                last_poll = time.monotonic()
+
+
+def _entity_entry(entity_id, domain, state):
+    """Build the get_all_entities() entry for one entity state."""
+    attrs = state.get("attributes", {})
+    attrs_get = attrs.get
+    return {
+        "entity_id": entity_id,
+        "friendly_name": attrs_get("friendly_name", entity_id),
+        "state": state.get("state", "unknown"),
+        "domain": domain,
+        "device_class": attrs_get("device_class"),
+        "unit_of_measurement": attrs_get("unit_of_measurement"),
+        "icon": attrs_get("icon"),
+        "attribute_keys": [k for k in attrs if k not in _LISTED_ATTRIBUTE_KEYS],
+    }
+
+
+def _entity_sort_key(entry):
+    return entry.get("friendly_name", "").lower()
@@ -7,19 +7,28 @@ Runs an aiohttp web server with:
 """
 
 import asyncio
-import json
+import gzip
+import hashlib
 import logging
 import os
 import sys
 import time
 import secrets
+from datetime import datetime, timezone
 
 import aiohttp as aiohttp_client
 from aiohttp import web
+from multidict import CIMultiDict, CIMultiDictProxy
 
 from config_manager import ConfigManager
 from ha_client import HAClient
 from audit_logger import AuditLogger
+import fast_json
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - optional speedup
+    uvloop = None
 
 # Configure logging
 logging.basicConfig(
@@ -33,37 +42,36 @@ logger = logging.getLogger("clawbridge")
 config_mgr = ConfigManager()
 ha_client = HAClient()
 audit_logger = AuditLogger()
-ingress_url = ""  # Will be set at startup
 
 # Rate limiting: per-IP token bucket
-_rate_buckets = {}  # ip -> { tokens, last_refill }
+# ip -> (micro-tokens, time.monotonic_ns() of last refill), least recently
+# seen first. Bounded so a flood of distinct addresses can't grow it between
+# stale-data sweeps
+_rate_buckets = {}
+RATE_BUCKETS_MAX = 10000
+RATE_TOKEN = 1_000_000  # one request, in micro-tokens
 
 # Pending confirmation actions: { action_id: { domain, service, entity_id, data, timestamp, status, source_ip } }
 _pending_actions = {}
 
-# WebSocket clients: list of (ws, subscribed_entity_ids_set)
-_ws_clients = []
+# Encoded /api/ai-sensors payloads: key_id -> (body, headers with ETag). Valid
+# for the (HA revision, config revision) pair in _ai_sensors_cache_revisions
+_ai_sensors_cache = {}
+_ai_sensors_cache_revisions = None
 
+# Encoded responses built only from the config: name -> (config revision, body)
+_config_json_cache = {}
 
-async def fetch_ingress_url():
-    """Fetch the ingress URL from the Supervisor API."""
-    global ingress_url
-    token = os.environ.get("SUPERVISOR_TOKEN", "")
-    try:
-        async with aiohttp_client.ClientSession(
-            headers={"Authorization": f"Bearer {token}"}
-        ) as session:
-            async with session.get("http://supervisor/addons/self/info") as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    addon_data = data.get("data", {})
-                    ingress_url = addon_data.get("ingress_url", "")
-                    logger.info("Ingress URL from Supervisor: %s", ingress_url)
-                else:
-                    body = await resp.text()
-                    logger.warning("Failed to get addon info: HTTP %d - %s", resp.status, body)
-    except Exception as e:
-        logger.warning("Failed to fetch ingress URL: %s", e)
+# /api/states lists longer than this are streamed in chunks of this many states
+STREAM_CHUNK_ITEMS = 500
+
+# Per-key effective entity maps: key token -> (config revision, access dict)
+_effective_cache = {}
+ACCESS_LEVEL_NAMES = ("read", "confirm", "control")
+ACCESS_LEVEL_RANKS = {name: rank for rank, name in enumerate(ACCESS_LEVEL_NAMES)}
+
+# WebSocket clients: list of (ws, subscribed_entity_ids_set)
+_ws_clients = []
 
 
 # ──────────────────────────────────────────────
@@ -81,28 +89,46 @@ def _get_client_ip(request):
     return "unknown"
 
 
+@web.middleware
+async def security_middleware(request, handler):
+    """Resolve the client IP once per request (as request["client_ip"]) and
+    enforce the IP allowlist for the handlers in IP_CHECKED_HANDLERS.
+    """
+    ip = request["client_ip"] = _get_client_ip(request)
+    route_handler = request.match_info.handler
+    if route_handler in IP_CHECKED_HANDLERS and not _check_ip_allowlist(ip):
+        body = IP_DENIED_LEGACY_BODY if route_handler is api_ai_action else IP_DENIED_BODY
+        return _error_response(body, 403)
+    return await handler(request)
+
+
 def _check_rate_limit(ip, custom_limit=None):
     """Token bucket rate limiter. Returns True if allowed, False if exceeded."""
     limit = custom_limit or config_mgr.rate_limit_per_minute
-    now = time.time()
-
-    if ip not in _rate_buckets:
-        _rate_buckets[ip] = {"tokens": limit, "last_refill": now}
-
-    bucket = _rate_buckets[ip]
-    elapsed = now - bucket["last_refill"]
-    bucket["tokens"] = min(limit, bucket["tokens"] + elapsed * (limit / 60.0))
-    bucket["last_refill"] = now
+    now = time.monotonic_ns()
+    capacity = limit * RATE_TOKEN
+
+    bucket = _rate_buckets.pop(ip, None)
+    if bucket is None:
+        tokens = capacity
+        if len(_rate_buckets) >= RATE_BUCKETS_MAX:
+            del _rate_buckets[next(iter(_rate_buckets))]
+    else:
+        tokens, last_refill = bucket
+        # limit tokens per 60s: (elapsed_ns / 60e9) * limit * RATE_TOKEN
+        tokens = min(capacity, tokens + (now - last_refill) * limit // 60_000)
 
-    if bucket["tokens"] >= 1:
-        bucket["tokens"] -= 1
-        return True
-    return False
+    allowed = tokens >= RATE_TOKEN
+    if allowed:
+        tokens -= RATE_TOKEN
+    # Re-inserting moves the IP to the most recently seen end
+    _rate_buckets[ip] = (tokens, now)
+    return allowed
 
 
 def _check_ip_allowlist(ip):
     """Check if IP is in allowlist (empty list = allow all)."""
-    allowed = config_mgr.allowed_ips
+    allowed = config_mgr.allowed_ip_set
     if not allowed:
         return True
     return ip in allowed
@@ -128,6 +154,7 @@ def _check_api_key(request):
 def _get_effective_entities(key_config):
     """Get the effective entity access dict for an API key.
     If key has its own entities, intersect with global. Otherwise use global.
+    The result is shared between requests, so callers must not modify it.
     """
     global_entities = config_mgr.exposed_entities
     if not key_config:
@@ -135,27 +162,93 @@ def _get_effective_entities(key_config):
     key_entities = key_config.get("entities", {})
     if not key_entities:
         return global_entities
+
+    token = key_config.get("key")
+    revision = config_mgr.revision
+    cached = _effective_cache.get(token)
+    if cached is not None and cached[0] == revision:
+        return cached[1]
+
     # Intersect: key can only access entities that are also globally exposed
     result = {}
     for eid, key_access in key_entities.items():
         global_access = global_entities.get(eid)
         if global_access:
-            # Take the more restrictive access level
-            levels = {"read": 0, "confirm": 1, "control": 2}
-            min_level = min(levels.get(key_access, 0), levels.get(global_access, 0))
-            for name, val in levels.items():
-                if val == min_level:
-                    result[eid] = name
-                    break
+            # Take the more restrictive access level (unknown levels count as read)
+            result[eid] = ACCESS_LEVEL_NAMES[min(
+                ACCESS_LEVEL_RANKS.get(key_access, 0), ACCESS_LEVEL_RANKS.get(global_access, 0)
+            )]
+    if len(_effective_cache) > len(config_mgr.api_keys):
+        # Drop entries for deleted or rotated keys
+        _effective_cache.clear()
+    _effective_cache[token] = (revision, result)
     return result
 
 
-CORS_HEADERS = {
+# Built once as a read-only CIMultiDict, the type aiohttp copies response headers into
+CORS_HEADERS = CIMultiDictProxy(CIMultiDict({
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
     "Access-Control-Allow-Headers": "Content-Type, Authorization",
     "Cache-Control": "no-cache",
-}
+}))
+
+# Pre-encoded bodies for the fixed public API errors (the legacy AI endpoints
+# use an "error" key instead of "message")
+IP_DENIED_BODY = fast_json.dumps({"message": "IP not allowed"})
+IP_DENIED_LEGACY_BODY = fast_json.dumps({"error": "IP not allowed"})
+INVALID_KEY_BODY = fast_json.dumps({"message": "Invalid API key"})
+INVALID_KEY_LEGACY_BODY = fast_json.dumps({"error": "Invalid API key"})
+RATE_LIMITED_BODY = fast_json.dumps({"message": "Rate limit exceeded. Try again later."})
+RATE_LIMITED_LEGACY_BODY = fast_json.dumps({"error": "Rate limit exceeded"})
+HISTORY_RATE_LIMITED_BODY = fast_json.dumps({"message": "History rate limit exceeded (10/min)"})
+
+
+def json_response(data, status=200, headers=None):
+    """web.json_response, but encoded with fast_json (orjson in the add-on image)."""
+    return web.Response(
+        body=fast_json.dumps(data), status=status, headers=headers, content_type="application/json"
+    )
+
+
+async def _json_list_response(request, items, headers=None):
+    """json_response for a list. Long lists are encoded and written in chunks
+    of STREAM_CHUNK_ITEMS, so the client starts receiving before the whole
+    body is encoded and no single large buffer is built.
+    """
+    if len(items) <= STREAM_CHUNK_ITEMS:
+        return json_response(items, headers=headers)
+    resp = web.StreamResponse(headers=headers)
+    resp.content_type = "application/json"
+    await resp.prepare(request)
+    separator = b"["
+    for start in range(0, len(items), STREAM_CHUNK_ITEMS):
+        # Encode the slice as an array, then drop its brackets
+        chunk = fast_json.dumps(items[start:start + STREAM_CHUNK_ITEMS])
+        await resp.write(separator + chunk[1:-1])
+        separator = b","
+    await resp.write(b"]")
+    await resp.write_eof()
+    return resp
+
+
+def _error_response(body, status):
+    """Public API error response from one of the pre-encoded *_BODY constants."""
+    return web.Response(body=body, status=status, headers=CORS_HEADERS, content_type="application/json")
+
+
+def _config_json_response(name, build):
+    """json_response for data taken only from the config, encoded once per config revision."""
+    revision = config_mgr.revision
+    cached = _config_json_cache.get(name)
+    if cached is None or cached[0] != revision:
+        cached = _config_json_cache[name] = (revision, fast_json.dumps(build()))
+    return web.Response(body=cached[1], content_type="application/json")
+
+
+async def _read_json(request):
+    """Parse a JSON request body with fast_json."""
+    return fast_json.loads(await request.read())
 
 
 def _friendly_name(entity_id):
@@ -195,16 +288,58 @@ async def _send_confirm_notification(action_id, domain, service, entity_id):
 # UI Routes (authenticated via ingress)
 # ──────────────────────────────────────────────
 
-async def handle_index(request):
-    """Serve the main setup UI with CSS/JS inlined."""
-    static_dir = os.path.join(os.path.dirname(__file__), "static")
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+STATIC_CONTENT_TYPES = {
+    ".css": "text/css",
+    ".js": "application/javascript",
+    ".html": "text/html",
+    ".png": "image/png",
+    ".svg": "image/svg+xml",
+    ".ico": "image/x-icon",
+}
+# Text assets are kept in memory (gzipped); anything else is sent from disk
+STATIC_TEXT_EXTENSIONS = frozenset({".css", ".js", ".html", ".svg"})
+
+
+def _compress(body):
+    """Gzip a response body, or None when that doesn't make it smaller."""
+    compressed = gzip.compress(body)
+    return compressed if len(compressed) < len(body) else None
+
+
+def _etag(body):
+    """Strong ETag for a response body."""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
 
-    with open(os.path.join(static_dir, "index.html"), "r") as f:
-        html = f.read()
-    with open(os.path.join(static_dir, "style.css"), "r") as f:
-        css = f.read()
-    with open(os.path.join(static_dir, "app.js"), "r") as f:
-        js = f.read()
+def _load_static_files():
+    """Index the static directory once.
+
+    Returns ({filename: (raw, gzipped, etag, content_type)} for text assets,
+    {filename: (path, content_type)} for binary ones).
+    """
+    files = {}
+    binary = {}
+    with os.scandir(STATIC_DIR) as it:
+        entries = [entry for entry in it if entry.is_file()]
+    for entry in entries:
+        filename = entry.name
+        ext = os.path.splitext(filename)[1]
+        content_type = STATIC_CONTENT_TYPES.get(ext, "application/octet-stream")
+        if ext not in STATIC_TEXT_EXTENSIONS:
+            binary[filename] = (entry.path, content_type)
+            continue
+        with open(entry.path, "rb") as f:
+            raw = f.read()
+        files[filename] = (raw, _compress(raw), _etag(raw), content_type)
+    return files, binary
+
+
+def _build_index_template(static_files):
+    """Return index.html with the stylesheet and script inlined."""
+    html = static_files["index.html"][0].decode()
+    css = static_files["style.css"][0].decode()
+    js = static_files["app.js"][0].decode()
 
     html = html.replace(
         '<link rel="stylesheet" href="{{INGRESS_PATH}}/static/style.css">',
@@ -214,48 +349,64 @@ async def handle_index(request):
         '<script src="{{INGRESS_PATH}}/static/app.js"></script>',
         f"<script>{js}</script>"
     )
+    return html
+
+
+def _cached_response(request, raw, compressed, etag, content_type):
+    """Serve a preloaded body, gzipped when the client accepts it.
+
+    Browsers keep a copy but must revalidate it, which costs a 304 while the
+    add-on hasn't been updated.
+    """
+    headers = {"Cache-Control": "no-cache", "ETag": etag}
+    if compressed is not None:
+        headers["Vary"] = "Accept-Encoding"
+    if request.headers.get("If-None-Match") == etag:
+        return web.Response(status=304, headers=headers)
+    body = raw
+    if compressed is not None and "gzip" in request.headers.get("Accept-Encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        body = compressed
+    return web.Response(body=body, content_type=content_type, headers=headers)
 
-    base_path = ingress_url.rstrip("/")
+
+async def handle_index(request):
+    """Serve the main setup UI with CSS/JS inlined."""
+    base_path = ha_client.ingress_url.rstrip("/")
     if not base_path:
         base_path = request.headers.get("X-Ingress-Path", "")
-    logger.debug("Serving index with base_path: %s", base_path)
 
-    html = html.replace(
-        "const BASE_PATH = window.location.pathname.replace(/\\/$/, '');",
-        f"const BASE_PATH = '{base_path}';"
-    )
+    # Rendered pages per base_path; normally there is only the one
+    index_cache = request.app["index_cache"]
+    cached = index_cache.get(base_path)
+    if cached is None:
+        logger.debug("Rendering index with base_path: %s", base_path)
+        html = request.app["index_template"].replace(
+            "const BASE_PATH = window.location.pathname.replace(/\\/$/, '');",
+            f"const BASE_PATH = '{base_path}';"
+        )
+        body = html.encode()
+        cached = index_cache[base_path] = (body, _compress(body), _etag(body))
 
-    return web.Response(text=html, content_type="text/html", headers={"Cache-Control": "no-store"})
+    return _cached_response(request, *cached, "text/html")
 
 
 async def handle_static(request):
     """Serve static files (fallback)."""
     filename = request.match_info.get("filename", "")
-    static_dir = os.path.join(os.path.dirname(__file__), "static")
-    filepath = os.path.join(static_dir, filename)
+    cached = request.app["static_files"].get(filename)
+    if cached is not None:
+        return _cached_response(request, *cached)
 
-    if not os.path.exists(filepath):
+    binary = request.app["static_binary"].get(filename)
+    if binary is None:
         raise web.HTTPNotFound()
-
-    content_types = {
-        ".css": "text/css",
-        ".js": "application/javascript",
-        ".png": "image/png",
-        ".svg": "image/svg+xml",
-        ".ico": "image/x-icon",
-    }
-    ext = os.path.splitext(filename)[1]
-    content_type = content_types.get(ext, "application/octet-stream")
-
-    with open(filepath, "r" if ext in (".css", ".js", ".svg") else "rb") as f:
-        content = f.read()
-
-    return web.Response(
-        body=content if isinstance(content, bytes) else None,
-        text=content if isinstance(content, str) else None,
-        content_type=content_type,
-        headers={"Cache-Control": "no-store"},
-    )
+    filepath, content_type = binary
+    # Let aiohttp sendfile() these rather than copying them through Python
+    return web.FileResponse(filepath, headers={
+        "Content-Type": content_type,
+        "Cache-Control": "public, max-age=3600",
+    })
 
 
 # ──────────────────────────────────────────────
@@ -269,9 +420,9 @@ async def api_get_entities(request):
     annotations = config_mgr.entity_annotations
     constraints = config_mgr.entity_constraints
     schedules = config_mgr.entity_schedules
-    return web.json_response({
+    return json_response({
         "domains": domains,
-        "exposed_entities": exposed,
+        "exposed_entities": dict(exposed),
         "annotations": annotations,
         "constraints": constraints,
         "entity_schedules": schedules,
@@ -281,7 +432,7 @@ async def api_get_entities(request):
 
 async def api_save_selection(request):
     """Save the entity selection (unified exposed_entities dict)."""
-    data = await request.json()
+    data = await _read_json(request)
     exposed = data.get("exposed_entities")
     if exposed is not None and isinstance(exposed, dict):
         config_mgr.exposed_entities = exposed
@@ -289,12 +440,28 @@ async def api_save_selection(request):
         entities = data.get("entities", [])
         if entities:
             config_mgr.selected_entities = entities
-    return web.json_response({"status": "ok", "count": len(config_mgr.exposed_entities)})
+    return json_response({"status": "ok", "count": len(config_mgr.exposed_entities)})
+
+
+async def api_set_entity_access(request):
+    """Set the access level of a single entity ("off" removes it)."""
+    try:
+        data = await _read_json(request)
+    except Exception:
+        return json_response({"error": "Invalid JSON"}, status=400)
+    entity_id = data.get("entity_id", "")
+    level = data.get("access_level", "")
+    if not entity_id or not isinstance(entity_id, str):
+        return json_response({"error": "Entity ID required"}, status=400)
+    if level not in ("read", "confirm", "control", "off"):
+        return json_response({"error": "Invalid access level"}, status=400)
+    config_mgr.set_entity_access(entity_id, level)
+    return json_response({"status": "ok", "count": len(config_mgr.exposed_entities)})
 
 
 async def api_get_settings(request):
     """Return current settings."""
-    return web.json_response({
+    return _config_json_response("settings", lambda: {
         "refresh_interval": config_mgr.refresh_interval,
         "filter_unavailable": config_mgr.filter_unavailable,
         "compact_mode": config_mgr.compact_mode,
@@ -310,176 +477,179 @@ async def api_get_settings(request):
 
 async def api_save_settings(request):
     """Save settings."""
-    data = await request.json()
-    if "refresh_interval" in data:
-        config_mgr.refresh_interval = data["refresh_interval"]
-    if "filter_unavailable" in data:
-        config_mgr.filter_unavailable = data["filter_unavailable"]
-    if "compact_mode" in data:
-        config_mgr.compact_mode = data["compact_mode"]
-    if "audit_enabled" in data:
-        config_mgr.audit_enabled = data["audit_enabled"]
-    if "audit_retention_days" in data:
-        config_mgr.audit_retention_days = data["audit_retention_days"]
-    if "rate_limit_per_minute" in data:
-        config_mgr.rate_limit_per_minute = data["rate_limit_per_minute"]
-    if "allowed_ips" in data:
-        config_mgr.allowed_ips = data["allowed_ips"]
-    if "confirm_timeout_seconds" in data:
-        config_mgr.confirm_timeout_seconds = data["confirm_timeout_seconds"]
-    if "confirm_notify_service" in data:
-        config_mgr.confirm_notify_service = data["confirm_notify_service"]
-    if "ai_name" in data:
-        config_mgr.ai_name = data["ai_name"]
-    return web.json_response({"status": "ok"})
+    data = await _read_json(request)
+    with config_mgr.batch():
+        if "refresh_interval" in data:
+            config_mgr.refresh_interval = data["refresh_interval"]
+        if "filter_unavailable" in data:
+            config_mgr.filter_unavailable = data["filter_unavailable"]
+        if "compact_mode" in data:
+            config_mgr.compact_mode = data["compact_mode"]
+        if "audit_enabled" in data:
+            config_mgr.audit_enabled = data["audit_enabled"]
+        if "audit_retention_days" in data:
+            config_mgr.audit_retention_days = data["audit_retention_days"]
+        if "rate_limit_per_minute" in data:
+            config_mgr.rate_limit_per_minute = data["rate_limit_per_minute"]
+        if "allowed_ips" in data:
+            config_mgr.allowed_ips = data["allowed_ips"]
+        if "confirm_timeout_seconds" in data:
+            config_mgr.confirm_timeout_seconds = data["confirm_timeout_seconds"]
+        if "confirm_notify_service" in data:
+            config_mgr.confirm_notify_service = data["confirm_notify_service"]
+        if "ai_name" in data:
+            config_mgr.ai_name = data["ai_name"]
+    return json_response({"status": "ok"})
 
 
 async def api_get_presets(request):
-    return web.json_response({"presets": config_mgr.presets})
+    return _config_json_response("presets", lambda: {"presets": config_mgr.presets})
 
 
 async def api_save_preset(request):
-    data = await request.json()
+    data = await _read_json(request)
     name = data.get("name", "")
     entities = data.get("entities", {})
     if not name:
-        return web.json_response({"error": "Preset name required"}, status=400)
+        return json_response({"error": "Preset name required"}, status=400)
     config_mgr.save_preset(name, entities)
-    return web.json_response({"status": "ok"})
+    return json_response({"status": "ok"})
 
 
 async def api_delete_preset(request):
     name = request.match_info.get("name", "")
     if config_mgr.delete_preset(name):
-        return web.json_response({"status": "ok"})
-    return web.json_response({"error": "Preset not found"}, status=404)
+        return json_response({"status": "ok"})
+    return json_response({"error": "Preset not found"}, status=404)
 
 
 async def api_load_preset(request):
     name = request.match_info.get("name", "")
     entities = config_mgr.load_preset(name)
     if entities is not None:
-        return web.json_response({"entities": entities})
-    return web.json_response({"error": "Preset not found"}, status=404)
+        return json_response({"entities": entities})
+    return json_response({"error": "Preset not found"}, status=404)
 
 
 async def api_export_config(request):
-    return web.json_response(config_mgr.export_config())
+    return web.Response(
+        body=config_mgr.export_config_pretty(), content_type="application/json"
+    )
 
 
 async def api_import_config(request):
-    data = await request.json()
+    data = await _read_json(request)
     config_mgr.import_config(data)
-    return web.json_response({"status": "ok"})
+    return json_response({"status": "ok"})
 
 
 async def api_get_services(request):
     services = await ha_client.get_services()
-    return web.json_response({"services": services})
+    return json_response({"services": services})
 
 
 # ── Annotations API (authenticated) ──────────
 
 async def api_save_annotations(request):
     """Save entity annotations."""
-    data = await request.json()
+    data = await _read_json(request)
     annotations = data.get("annotations", {})
     if isinstance(annotations, dict):
         config_mgr.entity_annotations = annotations
-    return web.json_response({"status": "ok"})
+    return json_response({"status": "ok"})
 
 
 async def api_save_annotation(request):
     """Save a single entity annotation."""
-    data = await request.json()
+    data = await _read_json(request)
     entity_id = data.get("entity_id", "")
     text = data.get("annotation", "")
     if entity_id:
         config_mgr.set_annotation(entity_id, text)
-    return web.json_response({"status": "ok"})
+    return json_response({"status": "ok"})
 
 
 # ── Constraints API (authenticated) ──────────
 
 async def api_save_constraints(request):
     """Save entity constraints."""
-    data = await request.json()
+    data = await _read_json(request)
     entity_id = data.get("entity_id", "")
     constraints = data.get("constraints", {})
     if entity_id:
         config_mgr.set_constraints(entity_id, constraints)
-    return web.json_response({"status": "ok"})
+    return json_response({"status": "ok"})
 
 
 async def api_get_constraints(request):
     """Get all constraints."""
-    return web.json_response({"constraints": config_mgr.entity_constraints})
+    return json_response({"constraints": config_mgr.entity_constraints})
 
 
 # ── API Keys Management (authenticated) ──────
 
 async def api_list_keys(request):
-    return web.json_response({"keys": config_mgr.list_api_keys()})
+    return json_response({"keys": config_mgr.list_api_keys()})
 
 
 async def api_create_key(request):
-    data = await request.json()
+    data = await _read_json(request)
     name = data.get("name", "Unnamed")
     entities = data.get("entities", {})
     rate_limit = data.get("rate_limit", 0)
     key_id, full_key = config_mgr.create_api_key(name, entities, rate_limit)
-    return web.json_response({"key_id": key_id, "key": full_key, "name": name})
+    return json_response({"key_id": key_id, "key": full_key, "name": name})
 
 
 async def api_delete_key(request):
     key_id = request.match_info.get("key_id", "")
     if config_mgr.delete_api_key(key_id):
-        return web.json_response({"status": "ok"})
-    return web.json_response({"error": "Key not found"}, status=404)
+        return json_response({"status": "ok"})
+    return json_response({"error": "Key not found"}, status=404)
 
 
 # ── Schedules Management (authenticated) ─────
 
 async def api_list_schedules(request):
-    return web.json_response({
+    return json_response({
         "schedules": config_mgr.schedules,
         "entity_schedules": config_mgr.entity_schedules,
     })
 
 
 async def api_create_schedule(request):
-    data = await request.json()
+    data = await _read_json(request)
     schedule_id = config_mgr.create_schedule(
         name=data.get("name", "Unnamed"),
         start=data.get("start", "00:00"),
         end=data.get("end", "23:59"),
         days=data.get("days", [0, 1, 2, 3, 4, 5, 6]),
     )
-    return web.json_response({"schedule_id": schedule_id})
+    return json_response({"schedule_id": schedule_id})
 
 
 async def api_update_schedule(request):
     schedule_id = request.match_info.get("schedule_id", "")
-    data = await request.json()
+    data = await _read_json(request)
     if config_mgr.update_schedule(schedule_id, **data):
-        return web.json_response({"status": "ok"})
-    return web.json_response({"error": "Schedule not found"}, status=404)
+        return json_response({"status": "ok"})
+    return json_response({"error": "Schedule not found"}, status=404)
 
 
 async def api_delete_schedule(request):
     schedule_id = request.match_info.get("schedule_id", "")
     if config_mgr.delete_schedule(schedule_id):
-        return web.json_response({"status": "ok"})
-    return web.json_response({"error": "Schedule not found"}, status=404)
+        return json_response({"status": "ok"})
+    return json_response({"error": "Schedule not found"}, status=404)
 
 
 async def api_set_entity_schedule(request):
-    data = await request.json()
+    data = await _read_json(request)
     entity_id = data.get("entity_id", "")
     schedule_id = data.get("schedule_id")  # None to remove
     if entity_id:
         config_mgr.set_entity_schedule(entity_id, schedule_id)
-    return web.json_response({"status": "ok"})
+    return json_response({"status": "ok"})
 
 
 # ── Confirmation Actions (authenticated) ─────
@@ -498,7 +668,7 @@ async def api_list_pending_actions(request):
                 "data": action.get("data", {}),
                 "age_seconds": int(now - action["timestamp"]),
             }
-    return web.json_response({"pending": active})
+    return json_response({"pending": active})
 
 
 async def api_action_approve(request):
@@ -506,11 +676,11 @@ async def api_action_approve(request):
     action_id = request.match_info.get("action_id", "")
     action = _pending_actions.get(action_id)
     if not action or action["status"] != "pending":
-        return web.json_response({"error": "Action not found or already resolved"}, status=404)
+        return json_response({"error": "Action not found or already resolved"}, status=404)
 
     if (time.time() - action["timestamp"]) > config_mgr.confirm_timeout_seconds:
         action["status"] = "expired"
-        return web.json_response({"error": "Action expired"}, status=410)
+        return json_response({"error": "Action expired"}, status=410)
 
     # Execute the service call
     ok, result = await ha_client.call_service(action["domain"], action["service"], action["data"])
@@ -525,8 +695,8 @@ async def api_action_approve(request):
     )
 
     if ok:
-        return web.json_response({"status": "approved", "result": result})
-    return web.json_response({"status": "approved", "error": result.get("error")}, status=502)
+        return json_response({"status": "approved", "result": result})
+    return json_response({"status": "approved", "error": result.get("error")}, status=502)
 
 
 async def api_action_deny(request):
@@ -534,7 +704,7 @@ async def api_action_deny(request):
     action_id = request.match_info.get("action_id", "")
     action = _pending_actions.get(action_id)
     if not action or action["status"] != "pending":
-        return web.json_response({"error": "Action not found or already resolved"}, status=404)
+        return json_response({"error": "Action not found or already resolved"}, status=404)
 
     action["status"] = "denied"
     await audit_logger.log_action(
@@ -543,7 +713,7 @@ async def api_action_deny(request):
         service=action["service"], source_ip=action.get("source_ip"),
         result="denied", error="user_denied",
     )
-    return web.json_response({"status": "denied"})
+    return json_response({"status": "denied"})
 
 
 # ── Audit API (authenticated) ────────────────
@@ -558,12 +728,12 @@ async def api_get_audit_logs(request):
         limit=limit, entity_filter=entity, result_filter=result,
         since=since, until=until,
     )
-    return web.json_response({"logs": logs, "count": len(logs)})
+    return json_response({"logs": logs, "count": len(logs)})
 
 
 async def api_clear_audit_logs(request):
     await audit_logger.clear_logs()
-    return web.json_response({"status": "ok"})
+    return json_response({"status": "ok"})
 
 
 # ── Stats API (authenticated) ────────────────
@@ -573,15 +743,15 @@ async def api_get_stats(request):
     hours = int(request.query.get("hours", 24))
     stats = await audit_logger.get_stats(hours=hours)
     # Add live info
-    stats["total_exposed"] = len(config_mgr.get_all_exposed_ids())
-    stats["total_read"] = len(config_mgr.get_read_entity_ids())
-    stats["total_confirm"] = len(config_mgr.get_confirm_entity_ids())
-    stats["total_control"] = len(config_mgr.get_control_entity_ids())
+    stats["total_exposed"] = config_mgr.count_exposed()
+    stats["total_read"] = config_mgr.count_exposed("read")
+    stats["total_confirm"] = config_mgr.count_exposed("confirm")
+    stats["total_control"] = config_mgr.count_exposed("control")
     stats["api_keys_count"] = len(config_mgr.api_keys)
     stats["schedules_count"] = len(config_mgr.schedules)
     stats["ws_connected"] = ha_client.ws_connected
     stats["ws_clients"] = len(_ws_clients)
-    return web.json_response(stats)
+    return json_response(stats)
 
 
 # ──────────────────────────────────────────────
@@ -590,12 +760,12 @@ async def api_get_stats(request):
 
 async def ha_api_root(request):
     """GET /api/ - HA compatibility: API health check."""
-    return web.json_response({"message": "API running."}, headers=CORS_HEADERS)
+    return json_response({"message": "API running."}, headers=CORS_HEADERS)
 
 
 async def ha_api_config(request):
     """GET /api/config - HA compatibility: minimal mock config."""
-    return web.json_response({
+    return json_response({
         "components": list(config_mgr.get_control_domains()),
         "version": "clawbridge-1.7.3",
         "location_name": "ClawBridge",
@@ -604,13 +774,9 @@ async def ha_api_config(request):
 
 async def ha_api_get_states(request):
     """GET /api/states - Return all exposed entities in HA state format."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"message": "IP not allowed"}, status=403, headers=CORS_HEADERS)
-
     key_id, key_config = _check_api_key(request)
     if key_id is None:
-        return web.json_response({"message": "Invalid API key"}, status=401, headers=CORS_HEADERS)
+        return _error_response(INVALID_KEY_BODY, 401)
 
     effective = _get_effective_entities(key_config)
     entity_ids = list(effective.keys())
@@ -632,30 +798,26 @@ async def ha_api_get_states(request):
             state["constraints"] = con
         state["access_level"] = effective.get(eid, "read")
 
-    return web.json_response(states, headers=CORS_HEADERS)
+    return await _json_list_response(request, states, headers=CORS_HEADERS)
 
 
 async def ha_api_get_state(request):
     """GET /api/states/{entity_id} - Return single entity if exposed, else 404."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"message": "IP not allowed"}, status=403, headers=CORS_HEADERS)
-
     key_id, key_config = _check_api_key(request)
     if key_id is None:
-        return web.json_response({"message": "Invalid API key"}, status=401, headers=CORS_HEADERS)
+        return _error_response(INVALID_KEY_BODY, 401)
 
     entity_id = request.match_info.get("entity_id", "")
     effective = _get_effective_entities(key_config)
 
     if entity_id not in effective:
-        return web.json_response(
+        return json_response(
             {"message": f"Entity not found: {entity_id}"}, status=404, headers=CORS_HEADERS
         )
 
     state = ha_client.get_ha_format_single(entity_id)
     if not state:
-        return web.json_response(
+        return json_response(
             {"message": f"Entity not found: {entity_id}"}, status=404, headers=CORS_HEADERS
         )
 
@@ -668,18 +830,14 @@ async def ha_api_get_state(request):
         state["constraints"] = con
     state["access_level"] = effective.get(entity_id, "read")
 
-    return web.json_response(state, headers=CORS_HEADERS)
+    return json_response(state, headers=CORS_HEADERS)
 
 
 async def ha_api_get_services(request):
     """GET /api/services - Return services only for domains with control/confirm entities."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"message": "IP not allowed"}, status=403, headers=CORS_HEADERS)
-
     key_id, key_config = _check_api_key(request)
     if key_id is None:
-        return web.json_response({"message": "Invalid API key"}, status=401, headers=CORS_HEADERS)
+        return _error_response(INVALID_KEY_BODY, 401)
 
     control_domains = config_mgr.get_control_domains()
     all_services = await ha_client.get_services()
@@ -687,55 +845,57 @@ async def ha_api_get_services(request):
     for domain, services in all_services.items():
         if domain in control_domains:
             filtered.append({"domain": domain, "services": services})
-    return web.json_response(filtered, headers=CORS_HEADERS)
+    return json_response(filtered, headers=CORS_HEADERS)
+
+
+# Read-safe services: these only return data and don't modify state,
+# so they are allowed for entities with "read" (or higher) access.
+READ_SAFE_SERVICES = frozenset({
+    ("todo", "get_items"),
+})
 
 
 async def ha_api_call_service(request):
     """POST /api/services/{domain}/{service} - HA-compatible service call with full validation."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"message": "IP not allowed"}, status=403, headers=CORS_HEADERS)
+    ip = request["client_ip"]
+    match_info = request.match_info
+    domain = match_info["domain"]
+    service = match_info["service"]
 
     key_id, key_config = _check_api_key(request)
     if key_id is None:
-        return web.json_response({"message": "Invalid API key"}, status=401, headers=CORS_HEADERS)
+        return _error_response(INVALID_KEY_BODY, 401)
 
     custom_rate = key_config.get("rate_limit") if key_config else None
     if not _check_rate_limit(ip, custom_rate if custom_rate else None):
         await audit_logger.log_action(
             "service_call", source_ip=ip, result="rate_limited",
-            domain=request.match_info.get("domain"),
-            service=request.match_info.get("service"),
-        )
-        return web.json_response(
-            {"message": "Rate limit exceeded. Try again later."}, status=429, headers=CORS_HEADERS
+            domain=domain, service=service,
         )
+        return _error_response(RATE_LIMITED_BODY, 429)
 
-    domain = request.match_info.get("domain", "")
-    service = request.match_info.get("service", "")
     start_time = time.time()
 
     try:
-        body = await request.json()
+        body = await _read_json(request)
     except Exception:
         body = {}
+    if type(body) is not dict:
+        body = {}
 
     effective = _get_effective_entities(key_config)
 
-    # Extract entity_id(s) from body
+    # Extract entity_id(s) from body; a single string is the common case
     raw_entity = body.get("entity_id")
-    entity_ids = []
-    if isinstance(raw_entity, str):
+    if type(raw_entity) is str:
         entity_ids = [raw_entity]
     elif isinstance(raw_entity, list):
         entity_ids = [e for e in raw_entity if isinstance(e, str)]
+    else:
+        entity_ids = []
 
-    # Read-safe services: these only return data and don't modify state,
-    # so they are allowed for entities with "read" (or higher) access.
-    READ_SAFE_SERVICES = {
-        ("todo", "get_items"),
-    }
     is_read_safe = (domain, service) in READ_SAFE_SERVICES
+    domain_prefix = domain + "."
 
     # Validate each entity against allowlist
     for eid in entity_ids:
@@ -745,7 +905,7 @@ async def ha_api_call_service(request):
                 "service_call", entity_id=eid, domain=domain, service=service,
                 source_ip=ip, result="denied", error="entity_not_exposed",
             )
-            return web.json_response(
+            return json_response(
                 {"message": f"Entity not exposed: {eid}"}, status=403, headers=CORS_HEADERS
             )
         if access == "read" and not is_read_safe:
@@ -753,13 +913,12 @@ async def ha_api_call_service(request):
                 "service_call", entity_id=eid, domain=domain, service=service,
                 source_ip=ip, result="denied", error="read_only_entity",
             )
-            return web.json_response(
+            return json_response(
                 {"message": f"Entity {eid} is read-only. Control access not granted."}, status=403, headers=CORS_HEADERS
             )
         # Verify domain matches
-        eid_domain = eid.split(".")[0] if "." in eid else ""
-        if eid_domain != domain:
-            return web.json_response(
+        if not eid.startswith(domain_prefix):
+            return json_response(
                 {"message": f"Domain mismatch: {eid} is not in domain {domain}"}, status=400, headers=CORS_HEADERS
             )
 
@@ -767,14 +926,14 @@ async def ha_api_call_service(request):
     if not entity_ids:
         control_entities_in_domain = [
             eid for eid, access in effective.items()
-            if access in ("control", "confirm") and eid.startswith(domain + ".")
+            if access in ("control", "confirm") and eid.startswith(domain_prefix)
         ]
         if not control_entities_in_domain:
             await audit_logger.log_action(
                 "service_call", domain=domain, service=service,
                 source_ip=ip, result="denied", error="domain_not_exposed",
             )
-            return web.json_response(
+            return json_response(
                 {"message": f"No control entities exposed in domain {domain}"}, status=403, headers=CORS_HEADERS
             )
         body["entity_id"] = control_entities_in_domain if len(control_entities_in_domain) > 1 else control_entities_in_domain[0]
@@ -791,7 +950,7 @@ async def ha_api_call_service(request):
                 domain=domain, service=service,
                 source_ip=ip, result="success", response_time_ms=elapsed_ms,
             )
-            return web.json_response(result, headers=CORS_HEADERS)
+            return json_response(result, headers=CORS_HEADERS)
         else:
             await audit_logger.log_action(
                 "service_call", entity_id=entity_ids[0] if entity_ids else None,
@@ -799,7 +958,7 @@ async def ha_api_call_service(request):
                 source_ip=ip, result="error", error=str(result.get("error", "")),
                 response_time_ms=elapsed_ms,
             )
-            return web.json_response(
+            return json_response(
                 {"message": result.get("error", "Service call failed")}, status=502, headers=CORS_HEADERS
             )
 
@@ -813,7 +972,7 @@ async def ha_api_call_service(request):
                 "service_call", entity_id=eid, domain=domain, service=service,
                 source_ip=ip, result="denied", error=f"schedule_restricted:{schedule_name}",
             )
-            return web.json_response(
+            return json_response(
                 {"message": f"Entity {eid} is outside its allowed time schedule ({schedule_name})"}, status=403, headers=CORS_HEADERS
             )
 
@@ -859,7 +1018,7 @@ async def ha_api_call_service(request):
             source_ip=ip, result="pending",
         )
 
-        return web.json_response({
+        return json_response({
             "action_id": action_id,
             "status": "pending",
             "message": f"Action requires human approval. Poll GET /api/actions/{action_id} for status.",
@@ -877,7 +1036,7 @@ async def ha_api_call_service(request):
             parameters={k: v for k, v in body.items() if k != "entity_id"},
             source_ip=ip, result="success", response_time_ms=elapsed_ms,
         )
-        return web.json_response(result, headers=CORS_HEADERS)
+        return json_response(result, headers=CORS_HEADERS)
     else:
         await audit_logger.log_action(
             "service_call", entity_id=entity_ids[0] if entity_ids else None,
@@ -885,7 +1044,7 @@ async def ha_api_call_service(request):
             source_ip=ip, result="error", error=str(result.get("error", "")),
             response_time_ms=elapsed_ms,
         )
-        return web.json_response(
+        return json_response(
             {"message": result.get("error", "Service call failed")}, status=502, headers=CORS_HEADERS
         )
 
@@ -894,20 +1053,16 @@ async def ha_api_call_service(request):
 
 async def ha_api_action_status(request):
     """GET /api/actions/{action_id} - Check confirmation action status."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"message": "IP not allowed"}, status=403, headers=CORS_HEADERS)
-
     action_id = request.match_info.get("action_id", "")
     action = _pending_actions.get(action_id)
     if not action:
-        return web.json_response({"message": "Action not found"}, status=404, headers=CORS_HEADERS)
+        return json_response({"message": "Action not found"}, status=404, headers=CORS_HEADERS)
 
     # Check expiry
     if action["status"] == "pending" and (time.time() - action["timestamp"]) > config_mgr.confirm_timeout_seconds:
         action["status"] = "expired"
 
-    return web.json_response({
+    return json_response({
         "action_id": action_id,
         "status": action["status"],
         "entity_id": action.get("entity_id"),
@@ -920,38 +1075,30 @@ async def ha_api_action_status(request):
 
 async def ha_api_get_constraints(request):
     """GET /api/constraints - Return all parameter constraints for exposed entities."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"message": "IP not allowed"}, status=403, headers=CORS_HEADERS)
-
     key_id, key_config = _check_api_key(request)
     if key_id is None:
-        return web.json_response({"message": "Invalid API key"}, status=401, headers=CORS_HEADERS)
+        return _error_response(INVALID_KEY_BODY, 401)
 
     effective = _get_effective_entities(key_config)
     all_constraints = config_mgr.entity_constraints
     # Only return constraints for entities this key can see
     filtered = {eid: con for eid, con in all_constraints.items() if eid in effective}
-    return web.json_response(filtered, headers=CORS_HEADERS)
+    return json_response(filtered, headers=CORS_HEADERS)
 
 
 # ── History endpoint (public) ────────────────
 
 async def ha_api_history(request):
     """GET /api/history/period/{timestamp} - Proxy HA history for exposed entities only."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"message": "IP not allowed"}, status=403, headers=CORS_HEADERS)
+    ip = request["client_ip"]
 
     # Stricter rate limit for history queries
     if not _check_rate_limit(ip + "_history", 10):
-        return web.json_response(
-            {"message": "History rate limit exceeded (10/min)"}, status=429, headers=CORS_HEADERS
-        )
+        return _error_response(HISTORY_RATE_LIMITED_BODY, 429)
 
     key_id, key_config = _check_api_key(request)
     if key_id is None:
-        return web.json_response({"message": "Invalid API key"}, status=401, headers=CORS_HEADERS)
+        return _error_response(INVALID_KEY_BODY, 401)
 
     effective = _get_effective_entities(key_config)
     timestamp = request.match_info.get("timestamp", "")
@@ -966,32 +1113,28 @@ async def ha_api_history(request):
         entity_ids = list(effective.keys())
 
     if not entity_ids:
-        return web.json_response([], headers=CORS_HEADERS)
+        return json_response([], headers=CORS_HEADERS)
 
     # Cap to 20 entities per history query for performance
     entity_ids = entity_ids[:20]
 
     history = await ha_client.get_history(timestamp, entity_ids, end_time)
-    return web.json_response(history, headers=CORS_HEADERS)
+    return json_response(history, headers=CORS_HEADERS)
 
 
 # ── Long-term statistics endpoint (public) ────────────────
 
 async def ha_api_statistics(request):
     """GET /api/history/statistics - Proxy HA long-term statistics for exposed entities only."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"message": "IP not allowed"}, status=403, headers=CORS_HEADERS)
+    ip = request["client_ip"]
 
     # Stricter rate limit for statistics queries
     if not _check_rate_limit(ip + "_history", 10):
-        return web.json_response(
-            {"message": "History rate limit exceeded (10/min)"}, status=429, headers=CORS_HEADERS
-        )
+        return _error_response(HISTORY_RATE_LIMITED_BODY, 429)
 
     key_id, key_config = _check_api_key(request)
     if key_id is None:
-        return web.json_response({"message": "Invalid API key"}, status=401, headers=CORS_HEADERS)
+        return _error_response(INVALID_KEY_BODY, 401)
 
     effective = _get_effective_entities(key_config)
 
@@ -1008,7 +1151,7 @@ async def ha_api_statistics(request):
         statistic_ids = list(effective.keys())
 
     if not statistic_ids:
-        return web.json_response({}, headers=CORS_HEADERS)
+        return json_response({}, headers=CORS_HEADERS)
 
     # Cap to 20 entities per statistics query for performance
     statistic_ids = statistic_ids[:20]
@@ -1017,20 +1160,16 @@ async def ha_api_statistics(request):
 
     # Filter response to only include exposed entities
     filtered = {k: v for k, v in statistics.items() if k in effective}
-    return web.json_response(filtered, headers=CORS_HEADERS)
+    return json_response(filtered, headers=CORS_HEADERS)
 
 
 # ── Context endpoint (public) ────────────────
 
 async def ha_api_context(request):
     """GET /api/context - Give AI a complete summary of its permissions and capabilities."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"message": "IP not allowed"}, status=403, headers=CORS_HEADERS)
-
     key_id, key_config = _check_api_key(request)
     if key_id is None:
-        return web.json_response({"message": "Invalid API key"}, status=401, headers=CORS_HEADERS)
+        return _error_response(INVALID_KEY_BODY, 401)
 
     effective = _get_effective_entities(key_config)
 
@@ -1067,7 +1206,7 @@ async def ha_api_context(request):
     actionable_domains = set()
     for eid, lvl in effective.items():
         if lvl in ("control", "confirm") and "." in eid:
-            actionable_domains.add(eid.split(".")[0])
+            actionable_domains.add(eid.partition(".")[0])
 
     available_services = []
     if actionable_domains:
@@ -1098,7 +1237,7 @@ async def ha_api_context(request):
         "Entities may belong to named groups (rooms/functions). Use group names for contextual understanding.",
     ]
 
-    return web.json_response({
+    return json_response({
         "summary": summary,
         "entities": {
             "read": read_entities,
@@ -1118,13 +1257,9 @@ async def ha_api_context(request):
 
 async def ha_api_websocket(request):
     """GET /api/websocket - WebSocket for real-time state change streaming."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"message": "IP not allowed"}, status=403)
-
     # Limit concurrent WebSocket connections to prevent resource exhaustion
     if len(_ws_clients) >= 50:
-        return web.json_response({"message": "Too many WebSocket connections"}, status=503)
+        return json_response({"message": "Too many WebSocket connections"}, status=503)
 
     ws = web.WebSocketResponse(heartbeat=30)
     await ws.prepare(request)
@@ -1136,7 +1271,7 @@ async def ha_api_websocket(request):
     has_api_keys = bool(config_mgr.api_keys)
 
     try:
-        msg = await asyncio.wait_for(ws.receive_json(), timeout=10)
+        msg = await asyncio.wait_for(ws.receive_json(loads=fast_json.loads), timeout=10)
     except (asyncio.TimeoutError, Exception):
         await ws.close(message=b"Auth timeout")
         return ws
@@ -1163,8 +1298,8 @@ async def ha_api_websocket(request):
         async for raw_msg in ws:
             if raw_msg.type == aiohttp_client.WSMsgType.TEXT:
                 try:
-                    data = json.loads(raw_msg.data)
-                except json.JSONDecodeError:
+                    data = fast_json.loads(raw_msg.data)
+                except fast_json.JSONDecodeError:
                     continue
 
                 msg_type = data.get("type")
@@ -1192,12 +1327,12 @@ async def _broadcast_state_change(entity_id, new_state, old_state):
     if not _ws_clients:
         return
 
-    message = json.dumps({
+    message = fast_json.dumps({
         "type": "state_changed",
         "entity_id": entity_id,
         "new_state": new_state,
         "old_state": old_state,
-    })
+    }).decode()
 
     dead_clients = []
     for client in _ws_clients:
@@ -1221,19 +1356,46 @@ async def _broadcast_state_change(entity_id, new_state, old_state):
 
 async def api_ai_sensors(request):
     """GET /api/ai-sensors - Legacy endpoint: sensor data + allowed actions."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"message": "IP not allowed"}, status=403, headers=CORS_HEADERS)
-
     key_id, key_config = _check_api_key(request)
     if key_id is None:
-        return web.json_response({"message": "Invalid API key"}, status=401, headers=CORS_HEADERS)
-
+        return _error_response(INVALID_KEY_BODY, 401)
+
+    # The payload only changes with HA states/areas or the config, so reuse
+    # the encoded body until either moves on. last_updated is the time of this
+    # response, so it is left out of the cached body and added per request
+    global _ai_sensors_cache_revisions
+    revisions = (ha_client.revision, config_mgr.revision)
+    if revisions != _ai_sensors_cache_revisions:
+        _ai_sensors_cache.clear()
+        _ai_sensors_cache_revisions = revisions
+    cached = _ai_sensors_cache.get(key_id)
+    if cached is None:
+        data = await _build_ai_sensors(key_config)
+        del data["last_updated"]
+        body = fast_json.dumps(data)
+        etag = _etag(body)
+        cached = (body, {**CORS_HEADERS, "ETag": etag})
+        # Only keep it if nothing changed while it was being built
+        if revisions == (ha_client.revision, config_mgr.revision):
+            _ai_sensors_cache[key_id] = cached
+    else:
+        # Building reads through ha_client; a cache hit still counts as access
+        ha_client.mark_access()
+    body, headers = cached
+    if request.headers.get("If-None-Match") == headers["ETag"]:
+        return web.Response(status=304, headers=headers)
+    # body is a non-empty JSON object: splice the timestamp in before its closing brace
+    now = fast_json.dumps(datetime.now(timezone.utc))
+    body = b"".join((body[:-1], b',"last_updated":', now, b"}"))
+    return web.Response(body=body, content_type="application/json", headers=headers)
+
+
+async def _build_ai_sensors(key_config):
+    """Assemble the /api/ai-sensors payload for an API key."""
     effective = _get_effective_entities(key_config)
-    all_exposed = list(effective.keys())
 
     data = await ha_client.get_exposed_data(
-        all_exposed,
+        effective,
         filter_unavailable=config_mgr.filter_unavailable,
         compact=config_mgr.compact_mode,
     )
@@ -1245,32 +1407,30 @@ async def api_ai_sensors(request):
     annotations = config_mgr.entity_annotations
     data["annotations"] = {eid: ann for eid, ann in annotations.items() if eid in effective}
 
-    return web.json_response(data, headers=CORS_HEADERS)
+    return data
 
 
 async def api_ai_action(request):
     """POST /api/ai-action - Legacy endpoint for AI to call an allowed service."""
-    ip = _get_client_ip(request)
-    if not _check_ip_allowlist(ip):
-        return web.json_response({"error": "IP not allowed"}, status=403, headers=CORS_HEADERS)
+    ip = request["client_ip"]
 
     if not _check_rate_limit(ip):
-        return web.json_response({"error": "Rate limit exceeded"}, status=429, headers=CORS_HEADERS)
+        return _error_response(RATE_LIMITED_LEGACY_BODY, 429)
 
     key_id, key_config = _check_api_key(request)
     if key_id is None:
-        return web.json_response({"error": "Invalid API key"}, status=401, headers=CORS_HEADERS)
+        return _error_response(INVALID_KEY_LEGACY_BODY, 401)
 
     effective = _get_effective_entities(key_config)
 
     try:
-        body = await request.json()
+        body = await _read_json(request)
     except Exception as e:
-        return web.json_response({"error": f"Invalid JSON: {e}"}, status=400)
+        return json_response({"error": f"Invalid JSON: {e}"}, status=400)
 
     service_id = body.get("service") or body.get("service_id")
     if not service_id or "." not in service_id:
-        return web.json_response({"error": "Missing or invalid 'service' (e.g. light.turn_on)"}, status=400)
+        return json_response({"error": "Missing or invalid 'service' (e.g. light.turn_on)"}, status=400)
 
     domain, service = service_id.split(".", 1)
     entity_id = body.get("entity_id")
@@ -1285,13 +1445,13 @@ async def api_ai_action(request):
                 "service_call", entity_id=entity_id, domain=domain, service=service,
                 source_ip=ip, result="denied", error="entity_not_exposed",
             )
-            return web.json_response({"error": f"Entity {entity_id} is not exposed"}, status=403)
+            return json_response({"error": f"Entity {entity_id} is not exposed"}, status=403)
         if access == "read":
             await audit_logger.log_action(
                 "service_call", entity_id=entity_id, domain=domain, service=service,
                 source_ip=ip, result="denied", error="read_only_entity",
             )
-            return web.json_response({"error": f"Entity {entity_id} is read-only"}, status=403)
+            return json_response({"error": f"Entity {entity_id} is read-only"}, status=403)
 
         # Check schedule
         if not config_mgr.is_within_schedule(entity_id):
@@ -1299,7 +1459,7 @@ async def api_ai_action(request):
                 "service_call", entity_id=entity_id, domain=domain, service=service,
                 source_ip=ip, result="denied", error="schedule_restricted",
             )
-            return web.json_response({"error": f"Entity {entity_id} is outside its allowed time schedule"}, status=403)
+            return json_response({"error": f"Entity {entity_id} is outside its allowed time schedule"}, status=403)
 
         # Check if confirmation required
         if access == "confirm":
@@ -1313,7 +1473,7 @@ async def api_ai_action(request):
             }
             # Send actionable notification with Approve/Deny buttons
             await _send_confirm_notification(action_id, domain, service, entity_id)
-            return web.json_response({
+            return json_response({
                 "action_id": action_id, "status": "pending",
                 "message": f"Requires human approval. Poll GET /api/actions/{action_id}",
             }, status=202, headers=CORS_HEADERS)
@@ -1328,7 +1488,7 @@ async def api_ai_action(request):
                 "service_call", domain=domain, service=service,
                 source_ip=ip, result="denied", error="domain_not_exposed",
             )
-            return web.json_response({"error": f"No control entities in domain {domain}"}, status=403)
+            return json_response({"error": f"No control entities in domain {domain}"}, status=403)
         entity_id = control_entities_in_domain[0] if len(control_entities_in_domain) == 1 else None
         extra_data["entity_id"] = control_entities_in_domain if len(control_entities_in_domain) > 1 else control_entities_in_domain[0]
 
@@ -1352,14 +1512,14 @@ async def api_ai_action(request):
             source_ip=ip, result="error", error=str(result.get("error", "")),
             response_time_ms=elapsed_ms,
         )
-        return web.json_response({"error": result.get("error", "Service call failed")}, status=502)
+        return json_response({"error": result.get("error", "Service call failed")}, status=502)
 
     await audit_logger.log_action(
         "service_call", entity_id=entity_id, domain=domain, service=service,
         parameters={k: v for k, v in service_data.items() if k != "entity_id"},
         source_ip=ip, result="success", response_time_ms=elapsed_ms,
     )
-    return web.json_response({"status": "ok", "result": result}, headers=CORS_HEADERS)
+    return json_response({"status": "ok", "result": result}, headers=CORS_HEADERS)
 
 
 async def handle_options(request):
@@ -1386,7 +1546,8 @@ async def _cleanup_stale_data():
             logger.debug("Cleaned %d stale pending actions", len(stale_actions))
 
         # Clean stale rate buckets (no activity for 5+ minutes)
-        stale_ips = [ip for ip, b in _rate_buckets.items() if (now - b["last_refill"]) > 300]
+        stale_before = time.monotonic_ns() - 300 * 1_000_000_000
+        stale_ips = [ip for ip, (_, last_refill) in _rate_buckets.items() if last_refill < stale_before]
         for ip in stale_ips:
             del _rate_buckets[ip]
         if stale_ips:
@@ -1459,39 +1620,34 @@ async def api_get_areas(request):
             "total": len(entity_ids),
             "exposed": exposed_count,
         }
-    return web.json_response({"areas": result})
+    return json_response({"areas": result})
 
 
 async def api_set_area_access(request):
     """POST /api/areas/access - Bulk set access level for all entities in an area."""
     try:
-        data = await request.json()
+        data = await _read_json(request)
     except Exception:
-        return web.json_response({"error": "Invalid JSON"}, status=400)
+        return json_response({"error": "Invalid JSON"}, status=400)
     area_name = data.get("area", "").strip()
     level = data.get("access_level", "")
     if not area_name:
-        return web.json_response({"error": "Area name required"}, status=400)
+        return json_response({"error": "Area name required"}, status=400)
     if level not in ("read", "confirm", "control", "off"):
-        return web.json_response({"error": "Invalid access level"}, status=400)
+        return json_response({"error": "Invalid access level"}, status=400)
 
     areas = await ha_client.get_entities_by_area()
     entity_ids = areas.get(area_name, [])
     if not entity_ids:
-        return web.json_response({"error": "Area not found or has no entities"}, status=404)
+        return json_response({"error": "Area not found or has no entities"}, status=404)
 
-    exposed = config_mgr.exposed_entities
     count = 0
-    for eid in entity_ids:
-        if level == "off":
-            if eid in exposed:
-                del exposed[eid]
+    with config_mgr.batch():
+        for eid in entity_ids:
+            previous = config_mgr.set_entity_access(eid, level)
+            if level != "off" or previous is not None:
                 count += 1
-        else:
-            exposed[eid] = level
-            count += 1
-    config_mgr.exposed_entities = exposed
-    return web.json_response({"status": "ok", "changed": count})
+    return json_response({"status": "ok", "changed": count})
 
 
 # ──────────────────────────────────────────────
@@ -1500,56 +1656,56 @@ async def api_set_area_access(request):
 
 async def api_list_groups(request):
     """GET /api/groups - List all entity groups."""
-    return web.json_response({"groups": config_mgr.entity_groups})
+    return json_response({"groups": config_mgr.entity_groups})
 
 
 async def api_create_group(request):
     """POST /api/groups - Create entity group."""
     try:
-        data = await request.json()
+        data = await _read_json(request)
     except Exception:
-        return web.json_response({"error": "Invalid JSON"}, status=400)
+        return json_response({"error": "Invalid JSON"}, status=400)
     name = data.get("name", "").strip()
     if not name:
-        return web.json_response({"error": "Group name required"}, status=400)
+        return json_response({"error": "Group name required"}, status=400)
     entities = data.get("entities", [])
     icon = data.get("icon", "")
     group_id = config_mgr.create_group(name, entities, icon)
-    return web.json_response({"status": "ok", "group_id": group_id})
+    return json_response({"status": "ok", "group_id": group_id})
 
 
 async def api_update_group(request):
     """POST /api/groups/{group_id} - Update entity group."""
     group_id = request.match_info["group_id"]
     try:
-        data = await request.json()
+        data = await _read_json(request)
     except Exception:
-        return web.json_response({"error": "Invalid JSON"}, status=400)
+        return json_response({"error": "Invalid JSON"}, status=400)
     if not config_mgr.update_group(group_id, **data):
-        return web.json_response({"error": "Group not found"}, status=404)
-    return web.json_response({"status": "ok"})
+        return json_response({"error": "Group not found"}, status=404)
+    return json_response({"status": "ok"})
 
 
 async def api_delete_group(request):
     """DELETE /api/groups/{group_id} - Delete entity group."""
     group_id = request.match_info["group_id"]
     if not config_mgr.delete_group(group_id):
-        return web.json_response({"error": "Group not found"}, status=404)
-    return web.json_response({"status": "ok"})
+        return json_response({"error": "Group not found"}, status=404)
+    return json_response({"status": "ok"})
 
 
 async def api_set_group_access(request):
     """POST /api/groups/{group_id}/access - Bulk set access level for all entities in a group."""
     group_id = request.match_info["group_id"]
     try:
-        data = await request.json()
+        data = await _read_json(request)
     except Exception:
-        return web.json_response({"error": "Invalid JSON"}, status=400)
+        return json_response({"error": "Invalid JSON"}, status=400)
     level = data.get("access_level", "")
     if level not in ("read", "confirm", "control", "off"):
-        return web.json_response({"error": "Invalid access level"}, status=400)
+        return json_response({"error": "Invalid access level"}, status=400)
     count = config_mgr.set_group_access_level(group_id, level)
-    return web.json_response({"status": "ok", "changed": count})
+    return json_response({"status": "ok", "changed": count})
 
 
 # ──────────────────────────────────────────────
@@ -1558,8 +1714,15 @@ async def api_set_group_access(request):
 
 async def on_startup(app):
     """Start HA client and background tasks on app startup."""
-    await fetch_ingress_url()
+    # Read the config on a worker thread while the network calls below run
+    config_load = asyncio.create_task(asyncio.to_thread(config_mgr.load))
+    static_load = asyncio.create_task(asyncio.to_thread(_load_static_files))
     await ha_client.start()
+    await config_load
+
+    app["static_files"], app["static_binary"] = await static_load
+    app["index_template"] = _build_index_template(app["static_files"])
+    app["index_cache"] = {}
 
     # Register state change broadcaster for WebSocket clients
     ha_client.subscribe_state_changes(_broadcast_state_change)
@@ -1580,16 +1743,41 @@ async def on_startup(app):
 
 async def on_cleanup(app):
     """Clean up on shutdown."""
-    for task_name in ("refresh_task", "audit_cleanup_task", "stale_cleanup_task"):
-        if task_name in app:
-            app[task_name].cancel()
+    tasks = [
+        app[task_name]
+        for task_name in ("refresh_task", "audit_cleanup_task", "stale_cleanup_task")
+        if task_name in app
+    ]
+    for task in tasks:
+        task.cancel()
+    # Let them finish unwinding before the HA session and audit log close
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await audit_logger.close()
+    config_mgr.flush(durable=True)
     await ha_client.stop()
     logger.info("ClawBridge stopped")
 
 
+# Handlers only reachable from allowlisted addresses (see security_middleware)
+IP_CHECKED_HANDLERS = frozenset({
+    ha_api_get_states,
+    ha_api_get_state,
+    ha_api_get_services,
+    ha_api_call_service,
+    ha_api_action_status,
+    ha_api_get_constraints,
+    ha_api_history,
+    ha_api_statistics,
+    ha_api_context,
+    ha_api_websocket,
+    api_ai_sensors,
+    api_ai_action,
+})
+
+
 def create_ingress_app():
     """Create the ingress app (authenticated UI + setup APIs)."""
-    app = web.Application()
+    app = web.Application(middlewares=[security_middleware])
 
     app.on_startup.append(on_startup)
     app.on_cleanup.append(on_cleanup)
@@ -1601,6 +1789,7 @@ def create_ingress_app():
     # Setup API routes (behind ingress auth)
     app.router.add_get("/api/entities", api_get_entities)
     app.router.add_post("/api/selection", api_save_selection)
+    app.router.add_post("/api/entity-access", api_set_entity_access)
     app.router.add_get("/api/settings", api_get_settings)
     app.router.add_post("/api/settings", api_save_settings)
     app.router.add_get("/api/presets", api_get_presets)
@@ -1659,7 +1848,7 @@ def create_ingress_app():
 
 def create_public_app():
     """Create the public app (HA-compatible + legacy AI endpoints, no auth required)."""
-    app = web.Application()
+    app = web.Application(middlewares=[security_middleware])
 
     # HA-compatible endpoints
     app.router.add_get("/api/", ha_api_root)
@@ -1723,4 +1912,8 @@ async def start_servers():
 
 if __name__ == "__main__":
     logger.info("Starting ClawBridge servers...")
-    asyncio.run(start_servers())
+    # uvloop ships in the add-on image; plain asyncio elsewhere (e.g. dev on Windows)
+    if uvloop is not None:
+        uvloop.run(start_servers())
+    else:
+        asyncio.run(start_servers())
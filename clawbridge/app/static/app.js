@@ -296,7 +296,14 @@ function _applyAccess(entityId, access) {
   renderEntityList();
   renderDomainList();
   updateExposedCount();
-  scheduleAutoSave();
+  saveEntityAccess(entityId, access);
+}
+
+async function saveEntityAccess(entityId, access) {
+  try {
+    await apiPost('/api/entity-access', { entity_id: entityId, access_level: access || 'off' });
+    showToast(`Saved! ${Object.keys(exposedEntities).length} entities exposed.`);
+  } catch (err) { console.error('Save failed:', err); }
 }
 
 function confirmSensitiveModal() {